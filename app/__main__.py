@@ -0,0 +1,154 @@
+"""Headless batch renderer for story specs (no Streamlit).
+
+    python -m app render specs.jsonl --workers 2 > results.jsonl
+    python -m app worker            # serve jobs queued from the Streamlit form
+    python -m app jobs              # queue depth, waits and per-worker throughput
+    python -m app sweep             # apply output retention and the disk quota now
+
+Each finished job prints one JSON line with its output paths and timings;
+a throughput summary (videos per hour) goes to stderr at the end.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .app import (ASSETS_DIR, JOBS_DB, WORKER_STALE, JobQueue, job_progress, load_specs, render_story,
+                  sweep_outputs, warm_ollama)
+
+
+def run_job(index: int, spec, out_dir: str, **render_kwargs) -> dict:
+    t0 = time.perf_counter()
+    try:
+        # stdout carries the result lines; MoviePy's progress chatter goes to stderr
+        with redirect_stdout(sys.stderr):
+            rendered = render_story(spec, out_dir=out_dir, **render_kwargs)
+        result = {"job": index, "status": "ok", **rendered}
+    except Exception as e:
+        result = {"job": index, "status": "error", "title": spec.title, "error": f"{type(e).__name__}: {e}"}
+    result["job_wall_s"] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def cmd_render(args) -> int:
+    try:
+        specs = load_specs(args.specs)
+    except (OSError, ValueError) as e:
+        print(f"Cannot load specs from {args.specs}: {e}", file=sys.stderr)
+        return 2
+    for model in {spec.ollama_model for spec in specs if spec.story_engine == "Ollama (local LLM)"}:
+        warm_ollama(model)
+    t0 = time.perf_counter()
+    failed = 0
+    videos = 0
+
+    def emit(result):
+        nonlocal failed, videos
+        failed += result["status"] != "ok"
+        videos += len(result.get("outputs", []))
+        print(json.dumps(result), flush=True)
+
+    if args.workers <= 1:
+        for i, spec in enumerate(specs):
+            emit(run_job(i, spec, args.out))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(run_job, i, spec, args.out) for i, spec in enumerate(specs)]
+            for fut in as_completed(futures):
+                emit(fut.result())
+
+    elapsed = time.perf_counter() - t0
+    rate = videos / elapsed * 3600 if elapsed > 0 else 0.0
+    print(f"{len(specs)} jobs ({failed} failed), {videos} videos in {elapsed:.1f}s — {rate:.1f} videos/hour "
+          f"with {args.workers} worker(s)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_worker(args) -> int:
+    jobs = JobQueue(args.db)
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    jobs.register(name)
+    warm_ollama()
+    stop = threading.Event()
+
+    def beat():
+        # Renders block the main loop for minutes; the heartbeat keeps the claimed job ours
+        while not stop.wait(WORKER_STALE / 4):
+            jobs.heartbeat(name)
+
+    threading.Thread(target=beat, daemon=True).start()
+    print(f"worker {name} serving {args.db}", file=sys.stderr)
+    try:
+        while True:
+            claimed = jobs.claim(name)
+            if claimed is None:
+                if args.drain:
+                    return 0
+                time.sleep(args.poll)
+                continue
+            job_id, spec, draft = claimed
+            result = run_job(job_id, spec, args.out, draft=draft,
+                             on_update=lambda report: jobs.progress(job_id, name, job_progress(report)))
+            if jobs.finish(job_id, name, result):
+                print(json.dumps(result), flush=True)
+            else:
+                print(f"job {job_id} was requeued while {name} was stalled; dropping this result", file=sys.stderr)
+            swept = sweep_outputs(args.out)
+            if swept["workdirs"] or swept["partials"] or swept["videos"]:
+                print(f"swept {json.dumps(swept)}", file=sys.stderr)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        stop.set()
+        jobs.heartbeat(name, alive=False)
+
+
+def cmd_jobs(args) -> int:
+    print(json.dumps(JobQueue(args.db).stats(), indent=2))
+    return 0
+
+
+def cmd_sweep(args) -> int:
+    print(json.dumps(sweep_outputs(args.out)))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("render", help="render every story spec in a JSON/JSONL file")
+    p.add_argument("specs", help="JSON list/object or JSONL file of story specs")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                   help="parallel render processes (default: half the CPUs)")
+    p.add_argument("--out", default=ASSETS_DIR, help=f"output directory (default: {ASSETS_DIR})")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser("worker", help="render jobs from the shared queue until interrupted")
+    p.add_argument("--db", default=JOBS_DB, help=f"queue database (default: {JOBS_DB})")
+    p.add_argument("--out", default=ASSETS_DIR, help=f"output directory (default: {ASSETS_DIR})")
+    p.add_argument("--poll", type=float, default=1.0, help="seconds between polls of an empty queue")
+    p.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+    p.set_defaults(func=cmd_worker)
+
+    p = sub.add_parser("jobs", help="print queue depth, waits and per-worker throughput as JSON")
+    p.add_argument("--db", default=JOBS_DB, help=f"queue database (default: {JOBS_DB})")
+    p.set_defaults(func=cmd_jobs)
+
+    p = sub.add_parser("sweep", help="expire old scratch dirs and videos, then enforce OUTPUT_QUOTA_MB")
+    p.add_argument("--out", default=ASSETS_DIR, help=f"output directory (default: {ASSETS_DIR})")
+    p.set_defaults(func=cmd_sweep)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
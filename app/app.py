@@ -13,6 +13,18 @@
 #   2) pip install -r requirements.txt   (or the inline list below)
 #   3) streamlit run app.py
 #
+# ▶ Batch (no Streamlit): one story spec per JSONL line (or a JSON list)
+#   python -m app render specs.jsonl --workers 2 > results.jsonl
+#   spec keys: title, age, theme, moral, minutes, scenes, story_engine, ollama_model,
+#              tts_engine, voice_hint, render_engine, formats (["instagram", "youtube"]),
+#              profile ("final", or "draft": 360p, 15 fps, ultrafast, fallback art, *_draft.mp4),
+#              variation (0 = reuse the cached story for these inputs; any other int = a new one)
+#
+# ▶ Job queue: the Streamlit form only enqueues; renders run in worker processes
+#   python -m app worker     (start.sh starts one; run more for parallel jobs)
+#   python -m app jobs       queue depth, waits, per-worker throughput
+#   JOBS_DB (default outputs/jobs.sqlite3), WORKER_STALE (s without heartbeat before a job is requeued)
+#
 # ▶ Python deps
 #   pip install streamlit moviepy pillow numpy pydub python-slugify
 #   # Optional (already used if present): requests pyttsx3
@@ -20,32 +32,97 @@
 #
 # ▶ Optional local tools (no subscription)
 #   • Ollama (LLMs): https://ollama.com (then: `ollama pull llama3.1:8b`)
+#       - Stories are streamed (OLLAMA_STREAM=0 disables): each scene's art and narration start as soon
+#         as the LLM finishes that scene instead of after the whole story.
+#       - Request profile: OLLAMA_FORMAT (json), OLLAMA_KEEP_ALIVE (30m), OLLAMA_NUM_PREDICT (0 = sized
+#         from the scene count), OLLAMA_OPTIONS (JSON, e.g. '{"temperature": 0.8, "num_ctx": 4096}').
+#         OLLAMA_MODEL is loaded at startup (OLLAMA_WARMUP=0 disables); run reports record
+#         load time and tokens/s.
 #   • Piper TTS: https://github.com/rhasspy/piper
 #       - Download a voice file (e.g. en_US-lessac-low.onnx)
 #       - Set env vars: PIPER_PATH, PIPER_VOICE
+#       - A persistent `piper --json-input` worker is kept per voice (PIPER_WORKER=0 disables)
 #       - Example (Windows PowerShell):
 #           $env:PIPER_PATH="C:/tools/piper/piper.exe"
 #           $env:PIPER_VOICE="C:/tools/piper/en_US-lessac-low.onnx"
 #   • Stable Diffusion WebUI: https://github.com/AUTOMATIC1111/stable-diffusion-webui
 #       - Start it locally, then set SD_API=http://127.0.0.1:7860
+#       - Results are cached on disk (SD_CACHE_MB); seeds are fixed per story + scene.
+#         SD_MODEL pins the checkpoint (otherwise the active one is read from the WebUI).
+#       - SD_CONCURRENCY scene requests are kept in flight; SD_TIMEOUT / OLLAMA_TIMEOUT,
+#         HTTP_RETRIES and HTTP_BACKOFF tune the shared HTTP client.
+#       - When the whole story is known up front, up to SD_BATCH scenes of one size go in a single
+#         request through the WebUI's built-in "Prompts from file or textbox" script (1.6+), each
+#         with its own prompt and seed. A batch may take SD_BATCH_TIMEOUT (2 × SD_TIMEOUT). If the
+#         batch gets any HTTP error or too few images, scenes are requested one by one for
+#         SD_COOLDOWN; timeouts and connection errors count against SD itself and are not retried.
+#       - Rendering both formats, SD draws one square master per scene (MASTER_CANVAS=0 draws each
+#         format separately); 9:16 and 16:9 are cut around its most detailed, central area and
+#         MASTER_PAD (0.2) of the difference is letterboxed over a blurred copy instead of cropped.
+#       - SD draws at its model's native size (about 512², 768² for SD 2.x, 1024² for SDXL-class
+#         checkpoints; SD_NATIVE overrides) in the output's aspect ratio, and the image is upscaled
+#         locally with Lanczos or, with SD_UPSCALER=extras:<name>, by the WebUI's extras upscaler.
+#         Run reports show the estimated SD time saved per scene (sd_ladder).
+#       - Each render probes SD once; after a failure all scenes use fallback art for
+#         SD_COOLDOWN seconds instead of waiting out SD_TIMEOUT per scene.
+#
+# ▶ Rendering (optional env vars)
+#   RENDER_WORKERS: concurrent scene encodes for "ffmpeg (parallel scenes)" (default: all cores)
+#   Profiles: "draft" (360p, 15 fps, x264 ultrafast, fallback art only, saved as *_draft.mp4) and
+#   "final". In the UI a draft's story, narration and scene timing are reused by its final render.
+#   Narration is assembled once per story (pydub + NumPy, frame-aligned per scene), encoded
+#   to AAC once and stream-copied into every format by every backend.
+#
+# ▶ Outputs & scratch (optional env vars)
+#   Every render gets a private scratch dir under WORK_ROOT (default outputs/.work; e.g. a tmpfs such
+#   as /dev/shm/kids-story) and publishes its MP4s atomically under unique names.
+#   WORK_RETENTION_H (24): kept draft narration / abandoned scratch; OUTPUT_RETENTION_DAYS (30, 0 = off);
+#   OUTPUT_QUOTA_MB (20480, 0 = off): oldest videos go first. Workers sweep after each job;
+#   `python -m app sweep` runs it by hand.
+#
+# ▶ Caches (optional env vars)
+#   CACHE_DIR (default outputs/.cache), TTS_CACHE_MB (narration WAVs, 0 = off),
+#   SD_CACHE_MB (Stable Diffusion PNGs, 0 = off), SEGMENT_CACHE_MB (encoded scene
+#   segments reused by "ffmpeg (parallel scenes)" when only some scenes changed, 0 = off),
+#   STORY_CACHE_MB (parsed Ollama stories keyed on model, prompt, form inputs and sampling
+#   options, 0 = off; tick "New story variation" in the form to bypass it)
 #
 # NOTE: pyttsx3 uses system voices (Windows SAPI5 / macOS NSSpeech / Linux eSpeak).
 
 import os
 import io
+import re
 import json
 import random
-from dataclasses import dataclass
-from typing import List, Tuple
+import queue
+import atexit
+import shlex
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+import wave
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import List, Optional, Tuple
 
-import streamlit as st
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
+from moviepy.config import get_setting
 from slugify import slugify
 
 # Optional imports
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except Exception:
     requests = None
 
@@ -54,6 +131,21 @@ try:
 except Exception:
     pyttsx3 = None
 
+try:
+    import warnings
+    with warnings.catch_warnings():  # pydub warns when ffmpeg isn't on PATH; FFMPEG_BIN is set below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        from pydub import AudioSegment  # narration track assembly
+except Exception:
+    AudioSegment = None
+
+try:
+    import resource  # peak RSS / child CPU time (POSIX only)
+except ImportError:
+    resource = None
+
+import sys
+import sqlite3
 import subprocess
 
 # ==============================
@@ -62,17 +154,71 @@ import subprocess
 INSTAGRAM_RES = (1080, 1920)   # 9:16
 YOUTUBE_RES   = (1920, 1080)   # 16:9
 FPS = 30
+ZOOM_END = 1.05                # gentle Ken Burns: 1.0 → 1.05 over each scene
+AUDIO_RATE = 44100
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or (os.cpu_count() or 1)  # parallel scene encodes
+
+# Same ffmpeg binary moviepy uses (FFMPEG_BINARY env var or imageio-ffmpeg)
+FFMPEG_BIN = get_setting("FFMPEG_BINARY")
+if AudioSegment is not None:
+    AudioSegment.converter = FFMPEG_BIN
 
 SD_API = os.getenv("SD_API")  # e.g. http://127.0.0.1:7860
+SD_MODEL = os.getenv("SD_MODEL")  # optional checkpoint override, e.g. dreamshaper_8.safetensors
+SD_STEPS = 25
+SD_SAMPLER = "Euler a"
+SD_CFG_SCALE = 6.5
+SD_TIMEOUT = float(os.getenv("SD_TIMEOUT", "180"))
+SD_CONCURRENCY = int(os.getenv("SD_CONCURRENCY", "2"))   # scene illustrations in flight at once
+SD_BATCH = int(os.getenv("SD_BATCH", "4"))                # scenes per txt2img request (1 = one request each)
+SD_BATCH_TIMEOUT = float(os.getenv("SD_BATCH_TIMEOUT", str(SD_TIMEOUT * 2)))  # cap for a whole batch request
+MASTER_CANVAS = os.getenv("MASTER_CANVAS", "1") != "0"    # one SD image per scene for all aspect ratios
+MASTER_PAD = float(os.getenv("MASTER_PAD", "0.2"))        # 0 = pure crop from the master, 1 = letterbox
+SD_NATIVE = os.getenv("SD_NATIVE", "auto")                # side SD draws at: auto (per model), 512, 768, 1024, 0 = output size
+SD_UPSCALER = os.getenv("SD_UPSCALER", "lanczos")         # lanczos, or extras:<WebUI upscaler>, e.g. extras:R-ESRGAN 4x+
+SD_PROBE_TIMEOUT = float(os.getenv("SD_PROBE_TIMEOUT", "5"))
+SD_COOLDOWN = float(os.getenv("SD_COOLDOWN", "300"))      # seconds on fallback art after SD fails
 OLLAMA_API = os.getenv("OLLAMA_API", "http://127.0.0.1:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "180"))
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "1") != "0"   # render scenes as the LLM finishes them
+OLLAMA_FORMAT = os.getenv("OLLAMA_FORMAT", "json")          # Ollama JSON mode; empty lets the model answer free-form
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")   # keep the model loaded between jobs
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "0"))  # token budget; 0 = sized from the scene count
+OLLAMA_OPTIONS = json.loads(os.getenv("OLLAMA_OPTIONS", '{"temperature": 0.8}'))  # any other Ollama options
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "1") != "0"     # load OLLAMA_MODEL when the app/worker starts
+
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))       # connect errors / 502-504, with backoff
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))   # seconds, doubled per retry
 
 PIPER_PATH = os.getenv("PIPER_PATH")       # path to piper executable
 PIPER_VOICE = os.getenv("PIPER_VOICE")     # path to voice .onnx
+PIPER_WORKER = os.getenv("PIPER_WORKER", "1") != "0"   # keep one piper process per voice loaded
+PIPER_TIMEOUT = float(os.getenv("PIPER_TIMEOUT", "120"))  # seconds per utterance
+
+log = logging.getLogger("kids_story")
 
 ASSETS_DIR = "outputs"
 os.makedirs(ASSETS_DIR, exist_ok=True)
 
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(ASSETS_DIR, ".cache"))
+TTS_CACHE_MB = int(os.getenv("TTS_CACHE_MB", "512"))   # 0 disables the narration cache
+TTS_RATE_WPM = 170
+SD_CACHE_MB = int(os.getenv("SD_CACHE_MB", "2048"))    # 0 disables the illustration cache
+SEGMENT_CACHE_MB = int(os.getenv("SEGMENT_CACHE_MB", "4096"))  # 0 disables scene segment reuse
+STORY_CACHE_MB = int(os.getenv("STORY_CACHE_MB", "64"))      # 0 disables the LLM story cache
+
+WORK_ROOT = os.getenv("WORK_ROOT", os.path.join(ASSETS_DIR, ".work"))   # per-job scratch dirs; a tmpfs works well
+WORK_RETENTION_H = float(os.getenv("WORK_RETENTION_H", "24"))    # kept draft narration / abandoned scratch files
+OUTPUT_RETENTION_DAYS = float(os.getenv("OUTPUT_RETENTION_DAYS", "30"))  # 0 keeps videos until the quota needs room
+OUTPUT_QUOTA_MB = int(os.getenv("OUTPUT_QUOTA_MB", "20480"))     # videos + reports + scratch; 0 = unlimited
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(ASSETS_DIR, "jobs.sqlite3"))
+WORKER_STALE = float(os.getenv("WORKER_STALE", "60"))  # seconds without a heartbeat before a worker's job is requeued
+
+STORY_ENGINES = ["Built-in (rule-based)", "Ollama (local LLM)"]
+TTS_ENGINES = ["pyttsx3 (offline)", "Piper (offline)", "eSpeak (offline)"]
+
 # ==============================
 # Data structures
 # ==============================
@@ -82,6 +228,396 @@ class Scene:
     prompt: str
     duration: float  # seconds
 
+
+@dataclass
+class SceneAsset:
+    image_path: Optional[str]  # None when a cached encoded segment is reused instead
+    wav_path: str
+    duration: float  # seconds, stretched to fit the narration
+    segment_key: Optional[str] = None   # content hash of everything that shapes the scene's video
+    segment_path: Optional[str] = None  # cached encoded segment for segment_key, if any
+    image: Optional[Image.Image] = None  # in-memory illustration for backends that never touch a PNG
+
+
+@dataclass
+class RenderTarget:
+    resolution: Tuple[int, int]
+    out_path: str
+    assets: List[SceneAsset]
+    audio_path: Optional[str] = None  # whole-story narration, AAC-encoded once and shared by every format
+    fps: int = FPS
+    preset: str = "medium"  # x264
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    name: str
+    scale: float   # of each format's full resolution
+    fps: int
+    preset: str    # x264
+    sd_art: bool   # False: fallback art only, never waits on Stable Diffusion
+    suffix: str = ""  # appended to output names so a draft never overwrites the final video
+
+    def resolution(self, full: Tuple[int, int]) -> Tuple[int, int]:
+        # Even dimensions for yuv420p
+        return tuple(max(2, round(v * self.scale / 2) * 2) for v in full)
+
+    def out_path(self, final_path: str) -> str:
+        stem, ext = os.path.splitext(final_path)
+        return stem + self.suffix + ext
+
+
+RENDER_PROFILES = {
+    "final": RenderProfile("final", 1.0, FPS, "medium", sd_art=True),
+    "draft": RenderProfile("draft", 1 / 3, 15, "ultrafast", sd_art=False, suffix="_draft"),  # 360p, for pacing/text
+}
+
+# ==============================
+# On-disk cache (content-addressed, LRU by total size)
+# ==============================
+
+class DiskCache:
+    # Size is tracked as a running total; the tree is only walked to seed it, when it goes over budget
+    # and every RESCAN_S (other processes write to the same tree).
+    RESCAN_S = 60.0
+    LOW_WATER = 0.9  # evict down to this share of max_bytes, so a full cache is not walked on every put
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+        self._scanned_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, key[:2], key + suffix)
+
+    def get(self, key: str, suffix: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)  # mtime doubles as the last-used time for LRU eviction
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def _vanished(self):
+        # A hit evicted by another process before it was read counts as a miss
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def read_bytes(self, key: str, suffix: str) -> Optional[bytes]:
+        path = self.get(key, suffix)
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self._vanished()
+            return None
+
+    def fetch(self, key: str, suffix: str, dst: str) -> Optional[str]:
+        # Hard-link (or copy) an entry to `dst` so later eviction cannot pull it from under the reader;
+        # `dst` shares the cached bytes and must not be written to
+        path = self.get(key, suffix)
+        if not path:
+            return None
+        try:
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(path, dst)
+            except OSError as e:
+                if isinstance(e, FileNotFoundError):
+                    raise
+                shutil.copyfile(path, dst)
+        except FileNotFoundError:
+            self._vanished()
+            return None
+        return dst
+
+    def put(self, key: str, suffix: str, src_path: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return self._publish(key, suffix, lambda tmp: shutil.copyfile(src_path, tmp))
+
+    def put_bytes(self, key: str, suffix: str, data: bytes) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        return self._publish(key, suffix, write)
+
+    def _publish(self, key: str, suffix: str, write) -> str:
+        dst = self.path(key, suffix)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}-{threading.get_ident()}.tmp"
+        write(tmp)
+        added = os.path.getsize(tmp)
+        try:
+            added -= os.path.getsize(dst)
+        except OSError:
+            pass
+        os.replace(tmp, dst)
+        with self._lock:
+            stale = self._size is None or time.monotonic() - self._scanned_at > self.RESCAN_S
+            if not stale:
+                self._size += added
+            over = stale or self._size > self.max_bytes
+        if over:
+            self.evict()
+        return dst
+
+    def evict(self):
+        entries, total = [], 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+                total += info.st_size
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes * self.LOW_WATER:
+                    break
+        with self._lock:
+            self._size, self._scanned_at = total, time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+TTS_CACHE = DiskCache(os.path.join(CACHE_DIR, "tts"), TTS_CACHE_MB * 1024 * 1024)
+SD_CACHE = DiskCache(os.path.join(CACHE_DIR, "sd"), SD_CACHE_MB * 1024 * 1024)
+SEGMENT_CACHE = DiskCache(os.path.join(CACHE_DIR, "segments"), SEGMENT_CACHE_MB * 1024 * 1024)
+STORY_CACHE = DiskCache(os.path.join(CACHE_DIR, "stories"), STORY_CACHE_MB * 1024 * 1024)
+CACHES = {"tts": TTS_CACHE, "sd": SD_CACHE, "segments": SEGMENT_CACHE, "stories": STORY_CACHE}
+
+# ==============================
+# HTTP client (pooled connections, retries, latency log)
+# ==============================
+
+class HttpClient:
+    KEEP = 4096  # latency samples kept; long-lived workers and the UI would otherwise grow without bound
+
+    def __init__(self, pool_size: int, retries: int, backoff: float):
+        retry = Retry(
+            total=retries, read=0, backoff_factor=backoff,
+            status_forcelist=(502, 503, 504), allowed_methods=None, raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latencies = deque(maxlen=self.KEEP)  # (seq, method, path, seconds, status), most recent only
+        self.seq = 0
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs):
+        t0 = time.perf_counter()
+        status = None
+        try:
+            r = self.session.request(method, url, **kwargs)
+            status = r.status_code
+            return r
+        finally:
+            path = "/" + url.split("://", 1)[-1].split("/", 1)[-1]
+            with self._lock:
+                self.seq += 1
+                self.latencies.append((self.seq, method, path, time.perf_counter() - t0, status))
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self, since: int = 0) -> dict:
+        # Per-endpoint summary of the requests after sequence number `since` (a report's snapshot of `seq`)
+        with self._lock:
+            rows = [row for row in self.latencies if row[0] > since]
+        out = {}
+        for _, method, path, seconds, status in rows:
+            entry = out.setdefault(f"{method} {path}", {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            entry["count"] += 1
+            entry["errors"] += status is None or status >= 400
+            entry["total_s"] += seconds
+            entry["max_s"] = max(entry["max_s"], seconds)
+        for entry in out.values():
+            entry["mean_s"] = entry["total_s"] / entry["count"]
+        return out
+
+
+HTTP = HttpClient(pool_size=max(4, SD_CONCURRENCY), retries=HTTP_RETRIES, backoff=HTTP_BACKOFF) if requests else None
+
+# ==============================
+# Run report (per-stage timings, written next to each MP4)
+# ==============================
+
+def cpu_seconds() -> float:
+    # This process plus finished children (ffmpeg, espeak, piper one-shots)
+    total = time.process_time()
+    if resource is not None:
+        ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+        total += ru.ru_utime + ru.ru_stime
+    return total
+
+
+def reset_peak_rss() -> bool:
+    # Linux: restart this process's high-water mark (VmHWM) at its current RSS. False where that is
+    # not possible, and peak_rss_mb() then covers the whole process lifetime.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def cache_counters() -> dict:
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def cache_deltas(since: dict) -> dict:
+    now = cache_counters()
+    return {name: {k: v - since.get(name, {}).get(k, 0) for k, v in counts.items()} for name, counts in now.items()}
+
+
+class RunReport:
+    # Spans may close on worker threads; wall time is per span, CPU and cache deltas are
+    # process-wide, so overlapping spans (parallel illustrations) share them.
+    def __init__(self, on_update=None, **meta):
+        self.meta = dict(meta)
+        self.spans = []
+        self.on_update = on_update  # called on the creating thread only (Streamlit needs its script thread)
+        self.created = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._owner = threading.current_thread()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = cpu_seconds()
+        self._caches0 = cache_counters()  # caches and HTTP are counted from here: process-wide totals
+        self._http0 = HTTP.seq if HTTP else 0  # would otherwise add up every earlier job in a worker
+        # Same for the memory peak; where it cannot be reset the field says it is the process's
+        self._rss_key = "peak_rss_mb" if reset_peak_rss() else "process_peak_rss_mb"
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str, **meta):
+        rec = {"stage": stage, **meta, "bytes_written": 0}
+        caches0 = cache_counters()
+        wall0, cpu0 = time.perf_counter(), cpu_seconds()
+        try:
+            yield rec
+        finally:
+            rec["start_s"] = round(wall0 - self._wall0, 4)
+            rec["wall_s"] = round(time.perf_counter() - wall0, 4)
+            rec["cpu_s"] = round(cpu_seconds() - cpu0, 4)
+            rec[self._rss_key] = peak_rss_mb()
+            caches1 = cache_counters()
+            rec["cache_hits"] = sum(caches1[n]["hits"] - caches0[n]["hits"] for n in caches1)
+            rec["cache_misses"] = sum(caches1[n]["misses"] - caches0[n]["misses"] for n in caches1)
+            with self._lock:
+                self.spans.append(rec)
+            if self.on_update and threading.current_thread() is self._owner:
+                self.on_update(self)
+
+    def stages(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        out = {}
+        for rec in spans:
+            agg = out.setdefault(rec["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes_written": 0,
+                                                "cache_hits": 0, "cache_misses": 0})
+            agg["count"] += 1
+            for name in ("wall_s", "cpu_s", "bytes_written", "cache_hits", "cache_misses"):
+                agg[name] += rec[name]
+        for agg in out.values():
+            agg["wall_s"] = round(agg["wall_s"], 4)
+            agg["cpu_s"] = round(agg["cpu_s"], 4)
+        return out
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "created": self.created,
+            **self.meta,
+            "wall_s": round(time.perf_counter() - self._wall0, 4),
+            "cpu_s": round(cpu_seconds() - self._cpu0, 4),
+            self._rss_key: peak_rss_mb(),
+            "stages": self.stages(),
+            "caches": cache_deltas(self._caches0),
+            "http": HTTP.stats(since=self._http0) if HTTP else {},
+            "spans": spans,
+        }
+
+    def write(self, path: str) -> str:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        return path
+
+
+def report_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + ".report.json"
+
+
+def run_figures(report: RunReport) -> dict:
+    # What the UI shows for a render, live or finished; plain JSON so a worker can publish it through the queue
+    figures = {"stages": report.stages(), "caches": cache_deltas(report._caches0),
+               "http": HTTP.stats(since=report._http0) if HTTP else {}}
+    if "sd" in report.meta or any(rec["stage"] == "sd_probe" for rec in report.spans):
+        figures["sd_breaker"] = report.meta.get("sd", {}).get("breaker") or SD_BREAKER.describe()
+    if "segments_reused" in report.meta:
+        figures["segments"] = {"scenes_reused": report.meta["scenes_reused"], "scenes": report.meta.get("scenes"),
+                               "reused": report.meta["segments_reused"], "encoded": report.meta["segments_encoded"]}
+    return figures
+
 # ==============================
 # Built-in rule-based story gen (always available)
 # ==============================
@@ -139,10 +675,81 @@ LLM_PROMPT = (
 )
 
 
-def generate_story_ollama(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str) -> Tuple[str, List[Scene]]:
-    if not requests:
-        raise RuntimeError("'requests' not installed for Ollama API.")
-    payload = {
+@dataclass
+class OllamaProfile:
+    format: Optional[str] = "json"
+    keep_alive: str = "30m"
+    num_predict: int = 0          # 0: PROMPT_TOKENS + tokens_per_scene per scene, so the model cannot ramble on
+    tokens_per_scene: int = 160   # 1–3 sentences plus an image prompt, with JSON overhead
+    options: dict = field(default_factory=dict)
+
+    PROMPT_TOKENS = 64  # title and closing braces
+
+    def request_fields(self, num_scenes: int) -> dict:
+        budget = self.num_predict or self.PROMPT_TOKENS + self.tokens_per_scene * num_scenes
+        fields = {"keep_alive": self.keep_alive, "options": {**self.options, "num_predict": budget}}
+        if self.format:
+            fields["format"] = self.format
+        return fields
+
+
+OLLAMA_PROFILE = OllamaProfile(format=OLLAMA_FORMAT or None, keep_alive=OLLAMA_KEEP_ALIVE,
+                               num_predict=OLLAMA_NUM_PREDICT, options=OLLAMA_OPTIONS)
+
+
+def ollama_metrics(msg: dict) -> dict:
+    # From Ollama's final message (durations are in nanoseconds)
+    ns = 1e9
+    out = {
+        "load_s": round(msg.get("load_duration", 0) / ns, 3),
+        "total_s": round(msg.get("total_duration", 0) / ns, 3),
+        "prompt_tokens": msg.get("prompt_eval_count"),
+        "tokens": msg.get("eval_count"),
+        "done_reason": msg.get("done_reason"),
+    }
+    if msg.get("prompt_eval_duration"):
+        out["prompt_tokens_per_s"] = round(msg.get("prompt_eval_count", 0) / (msg["prompt_eval_duration"] / ns), 1)
+    if msg.get("eval_duration"):
+        out["tokens_per_s"] = round(msg.get("eval_count", 0) / (msg["eval_duration"] / ns), 1)
+    return out
+
+
+_OLLAMA_WARM = set()
+_OLLAMA_WARM_LOCK = threading.Lock()
+
+
+def warm_ollama(model: str = OLLAMA_MODEL) -> Optional[threading.Thread]:
+    # An empty prompt makes Ollama load the model (and hold it for keep_alive) without generating;
+    # runs in the background so startup never waits on it. Failed attempts are retried on the next call.
+    if not requests or not OLLAMA_WARMUP:
+        return None
+    with _OLLAMA_WARM_LOCK:
+        if model in _OLLAMA_WARM:
+            return None
+        _OLLAMA_WARM.add(model)
+
+    def run():
+        try:
+            r = HTTP.post(f"{OLLAMA_API}/api/generate", json={"model": model, "keep_alive": OLLAMA_PROFILE.keep_alive},
+                          timeout=OLLAMA_TIMEOUT)
+            r.raise_for_status()
+            log.info("Ollama model %s loaded (%.2fs).", model, ollama_metrics(r.json())["load_s"])
+        except Exception as e:
+            log.info("Ollama warm-up for %s skipped: %s", model, e)
+            with _OLLAMA_WARM_LOCK:
+                _OLLAMA_WARM.discard(model)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def ollama_payload(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str,
+                   variation: int = 0) -> dict:
+    fields = OLLAMA_PROFILE.request_fields(num_scenes)
+    if variation:
+        fields["options"]["seed"] = variation
+    return {
         "model": model,
         "prompt": (
             f"{LLM_PROMPT}\n"
@@ -155,77 +762,712 @@ def generate_story_ollama(title: str, age: int, theme: str, moral: str, minutes:
             "Return only JSON."
         ),
         "stream": False,
+        **fields,
     }
-    r = requests.post(f"{OLLAMA_API}/api/generate", json=payload, timeout=180)
+
+
+def story_cache_key(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str,
+                    variation: int = 0) -> str:
+    # Everything that shapes the LLM's answer (the payload carries the prompt template, format and
+    # sampling options); keep_alive only affects the server. A new `variation` is a new story.
+    payload = ollama_payload(title, age, theme, moral, minutes, num_scenes, model, variation)
+    payload.pop("keep_alive", None)
+    payload.pop("stream", None)
+    return STORY_CACHE.key("story-v1", payload, variation)
+
+
+def cached_story(key: str) -> Optional[Tuple[str, List[Scene]]]:
+    blob = STORY_CACHE.read_bytes(key, ".json")
+    if not blob:
+        return None
+    data = json.loads(blob.decode("utf-8"))
+    return data["title"], [Scene(**sc) for sc in data["scenes"]]
+
+
+def store_story(key: str, title: str, scenes: List[Scene]):
+    data = {"title": title, "scenes": [asdict(sc) for sc in scenes]}
+    STORY_CACHE.put_bytes(key, ".json", json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def llm_scene(obj: dict, minutes: int, num_scenes: int) -> Scene:
+    return Scene(
+        obj.get("text", ""),
+        obj.get("prompt", "friendly illustration of the scene"),
+        max(3.5, min(10.0, (minutes * 60) / num_scenes)),
+    )
+
+
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def loads_repaired(text: str):
+    # json.loads, then again after fixing the usual LLM slips: prose or ``` fences around the
+    # object and trailing commas before } or ]
+    try:
+        return json.loads(text)
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            text = text[start:end + 1]
+        return json.loads(TRAILING_COMMA_RE.sub(r"\1", text))
+
+
+def parse_llm_story(text: str) -> Tuple[Optional[str], List[dict], bool]:
+    # (title, scene objects, complete). When the reply does not parse even after repair (typically
+    # cut off by num_predict), every complete scene object before the damage is salvaged.
+    try:
+        data = loads_repaired(text)
+        if isinstance(data, dict) and isinstance(data.get("scenes"), list):
+            return data.get("title"), [sc for sc in data["scenes"] if isinstance(sc, dict)], True
+    except ValueError:
+        pass
+    parser = SceneStreamParser()
+    objs = parser.feed(text)
+    return parser.title, objs, False
+
+
+def continue_story_ollama(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str,
+                          have: List[Scene], metrics: Optional[dict] = None, variation: int = 0) -> List[Scene]:
+    # One targeted request for just the scenes a truncated or malformed reply is missing,
+    # instead of regenerating the whole story
+    missing = num_scenes - len(have)
+    payload = ollama_payload(title, age, theme, moral, minutes, num_scenes, model, variation)
+    so_far = "\n".join(f"{i}. {sc.text}" for i, sc in enumerate(have, 1))
+    payload["prompt"] += (
+        f"\nScenes 1-{len(have)} are already written:\n{so_far}\n"
+        f"Write only the remaining {missing} scenes ({len(have) + 1}-{num_scenes}), continuing to the ending. "
+        'Return only JSON: {"scenes": [...]}.'
+    )
+    payload["options"]["num_predict"] = OLLAMA_PROFILE.request_fields(missing)["options"]["num_predict"]
+    r = HTTP.post(f"{OLLAMA_API}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT)
     r.raise_for_status()
-    text = r.json().get("response", "{}")
+    body = r.json()
+    _, objs, _ = parse_llm_story(body.get("response", ""))
+    scenes = [llm_scene(obj, minutes, num_scenes) for obj in objs][:missing]
+    if metrics is not None:
+        metrics["continue"] = {"missing": missing, "received": len(scenes), **ollama_metrics(body)}
+    return scenes
+
+
+def complete_story(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str,
+                   have: List[Scene], metrics: Optional[dict] = None, variation: int = 0) -> List[Scene]:
+    # The missing scenes, or none if the continue request fails: a short story beats no story
     try:
-        data = json.loads(text)
-        scenes = [
-            Scene(
-                s.get("text", ""),
-                s.get("prompt", "friendly illustration of the scene"),
-                max(3.5, min(10.0, (minutes * 60) / num_scenes)),
-            )
-            for s in data.get("scenes", [])
-        ]
-        if not scenes:
-            raise ValueError("No scenes in LLM output")
-        return data.get("title", title), scenes[:num_scenes]
-    except Exception:
-        # fallback to rule based if parsing fails
+        return continue_story_ollama(title, age, theme, moral, minutes, num_scenes, model, have, metrics, variation)
+    except Exception as e:
+        log.warning("Ollama continue request failed (%s); keeping %d of %d scenes.", e, len(have), num_scenes)
+        return []
+
+
+def generate_story_ollama(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int, model: str,
+                          metrics: Optional[dict] = None, variation: int = 0) -> Tuple[str, List[Scene]]:
+    # `metrics`, if given, receives ollama_metrics() of the response (or cache="hit")
+    key = story_cache_key(title, age, theme, moral, minutes, num_scenes, model, variation)
+    cached = cached_story(key)
+    if cached:
+        if metrics is not None:
+            metrics["cache"] = "hit"
+        return cached
+    if not requests:
+        raise RuntimeError("'requests' not installed for Ollama API.")
+    payload = ollama_payload(title, age, theme, moral, minutes, num_scenes, model, variation)
+    r = HTTP.post(f"{OLLAMA_API}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT)
+    r.raise_for_status()
+    body = r.json()
+    if metrics is not None:
+        metrics.update(ollama_metrics(body))
+    story_title, objs, complete = parse_llm_story(body.get("response", ""))
+    scenes = [llm_scene(obj, minutes, num_scenes) for obj in objs][:num_scenes]
+    if not scenes:
+        # fallback to rule based if nothing could be salvaged
         return generate_story_rule_based(title, age, theme, moral, minutes, num_scenes)
+    if not complete and metrics is not None:
+        metrics["salvaged"] = len(scenes)
+    if len(scenes) < num_scenes:
+        scenes += complete_story(title, age, theme, moral, minutes, num_scenes, model, scenes, metrics, variation)
+    story_title = story_title or title
+    if len(scenes) == num_scenes:  # short stories are not cached, so the next run tries again
+        store_story(key, story_title, scenes)
+    return story_title, scenes
+
+
+class SceneStreamParser:
+    # Incremental, tolerant reader for {"title": ..., "scenes": [{...}, ...]} arriving in arbitrary chunks.
+    # Every scene object is returned by feed() as soon as its closing brace arrives; code fences or prose
+    # around the JSON are ignored, trailing commas are repaired and a scene object that still does not
+    # parse is skipped.
+    TITLE_RE = re.compile(r'"title"\s*:\s*"((?:[^"\\]|\\.)*)"')
+    SCENES_RE = re.compile(r'"scenes"\s*:\s*\[')
+
+    def __init__(self):
+        self.buf = ""
+        self.title = None
+        self.done = False       # the scenes array is closed
+        self._pos = None        # scan position inside the scenes array
+        self._depth = 0
+        self._start = None      # where the current scene object began
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        self.buf += chunk
+        if self._pos is None:
+            m = self.SCENES_RE.search(self.buf)
+            self._find_title(m.start() if m else len(self.buf))
+            if not m:
+                return []
+            self._pos = m.end()
+        found = []
+        buf, i = self.buf, self._pos
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+            elif c == '"':
+                self._in_str = True
+            elif c == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        found.append(loads_repaired(buf[self._start:i + 1]))
+                    except ValueError:
+                        log.warning("Skipping unparsable scene from the LLM stream: %.80s", buf[self._start:i + 1])
+            elif c == "]" and self._depth == 0:
+                self.done = True
+            i += 1
+        self._pos = i
+        if self.done and self.title is None:
+            self._find_title(len(self.buf))
+        return found
+
+    def _find_title(self, end: int):
+        if self.title is None:
+            m = self.TITLE_RE.search(self.buf, 0, end)
+            if m:
+                self.title = json.loads(f'"{m.group(1)}"')
+
+
+class StoryStream:
+    # A story that is still being written: iterating yields each Scene as soon as it is complete, while
+    # the producer (an LLM token stream) runs on its own thread so slow consumers never stall it.
+    # `title` and `scenes` fill in as they arrive.
+    def __init__(self, produce, fallback_title: str):
+        self.title = None
+        self.scenes: List[Scene] = []
+        self.fallback_title = fallback_title
+        self.stats = {"first_scene_s": None, "total_s": None, "scenes": 0}  # seconds since the request
+        self._queue = queue.Queue()
+        self._title_ready = threading.Event()
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(produce,), daemon=True)
+        self._thread.start()
+
+    def _run(self, produce):
+        try:
+            produce(self)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self.stats["total_s"] = round(time.perf_counter() - self._t0, 3)
+            self._title_ready.set()
+            self._queue.put(None)
+
+    def set_title(self, title: str):
+        self.title = title
+        self._title_ready.set()
+
+    def put(self, scene: Scene):
+        if self.stats["first_scene_s"] is None:
+            self.stats["first_scene_s"] = round(time.perf_counter() - self._t0, 3)
+        self._title_ready.set()  # the title comes first in the JSON; once scenes flow there is none
+        self.scenes.append(scene)
+        self.stats["scenes"] = len(self.scenes)
+        self._queue.put(scene)
+
+    def wait_title(self) -> str:
+        self._title_ready.wait()
+        return self.title or self.fallback_title
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def stream_story_ollama(title: str, age: int, theme: str, moral: str, minutes: int, num_scenes: int,
+                        model: str, metrics: Optional[dict] = None, variation: int = 0) -> StoryStream:
+    # Like generate_story_ollama, but scenes are handed downstream while the LLM is still writing.
+    # A stream that fails before any scene falls back to the rule-based story; after that, the
+    # scenes received so far are kept and one continue request asks for the rest. The stream is
+    # read to its final message for `metrics`; num_predict bounds how long that can take.
+    key = story_cache_key(title, age, theme, moral, minutes, num_scenes, model, variation)
+
+    def produce(stream: StoryStream):
+        cached = cached_story(key)
+        if cached:
+            if metrics is not None:
+                metrics["cache"] = "hit"
+            stream.set_title(cached[0])
+            for sc in cached[1]:
+                stream.put(sc)
+            return
+        try:
+            if not requests:
+                raise RuntimeError("'requests' not installed for Ollama API.")
+            payload = {**ollama_payload(title, age, theme, moral, minutes, num_scenes, model, variation), "stream": True}
+            parser = SceneStreamParser()
+            with HTTP.post(f"{OLLAMA_API}/api/generate", json=payload, timeout=OLLAMA_TIMEOUT, stream=True) as r:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if not line:
+                        continue
+                    msg = json.loads(line)
+                    for obj in parser.feed(msg.get("response", "")):
+                        if len(stream.scenes) < num_scenes:
+                            if not stream.scenes and parser.title:
+                                # Only now: a stream that fails before its first scene becomes the
+                                # rule-based story, and wait_title() must hand out that story's title
+                                stream.set_title(parser.title)
+                            stream.put(llm_scene(obj, minutes, num_scenes))
+                    if msg.get("done"):
+                        if metrics is not None:
+                            metrics.update(ollama_metrics(msg))
+                        break
+            if not stream.scenes:
+                raise ValueError("No scenes in LLM output")
+            if not parser.done and metrics is not None:
+                metrics["salvaged"] = len(stream.scenes)
+        except Exception as e:
+            if not stream.scenes:
+                log.warning("Ollama failed (%s). Falling back to built-in.", e)
+                fallback_title, scenes = generate_story_rule_based(title, age, theme, moral, minutes, num_scenes)
+                stream.set_title(fallback_title)
+                for sc in scenes:
+                    stream.put(sc)
+                return
+            log.warning("Ollama stream ended early (%s) after %d scenes.", e, len(stream.scenes))
+        if len(stream.scenes) < num_scenes:
+            for sc in complete_story(title, age, theme, moral, minutes, num_scenes, model, list(stream.scenes),
+                                     metrics, variation):
+                stream.put(sc)
+        if len(stream.scenes) == num_scenes:  # short stories are not cached, so the next run tries again
+            store_story(key, stream.title or title, stream.scenes)
+
+    return StoryStream(produce, fallback_title=title)
 
 # ==============================
 # Illustration generation (local SD or fallback)
 # ==============================
 
-def sd_txt2img(prompt: str, width: int, height: int) -> Image.Image:
+class CircuitBreaker:
+    # Closed: calls go through. Open: callers skip straight to the fallback until the
+    # cool-down elapses, then the next call is let through as a trial.
+    def __init__(self, name: str, cooldown: float):
+        self.name = name
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.reason = ""
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                log.info("%s is back; closing circuit", self.name)
+            self.opened_at = None
+            self.reason = ""
+
+    def record_failure(self, reason: str):
+        with self._lock:
+            if self.opened_at is None:
+                log.warning("%s failed (%s); using fallback for %.0fs", self.name, reason, self.cooldown)
+            self.opened_at = time.monotonic()
+            self.reason = reason
+
+    def describe(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return f"{self.name}: available"
+            left = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+            return f"{self.name}: unavailable ({self.reason}); retrying in {left:.0f}s"
+
+
+SD_BREAKER = CircuitBreaker("Stable Diffusion", SD_COOLDOWN)
+SD_BATCH_BREAKER = CircuitBreaker("Stable Diffusion batching", SD_COOLDOWN)
+
+
+def sd_health_check() -> bool:
+    # Cheap probe run once per render, so a dead or hung server costs SD_PROBE_TIMEOUT once
+    if not SD_API or not requests:
+        return False
+    if not SD_BREAKER.allow():
+        log.info("Render log: %s", SD_BREAKER.describe())
+        return False
+    try:
+        r = HTTP.get(f"{SD_API}/sdapi/v1/progress", params={"skip_current_image": "true"}, timeout=SD_PROBE_TIMEOUT)
+        r.raise_for_status()
+    except Exception as e:
+        SD_BREAKER.record_failure(f"{type(e).__name__}: {e}")
+        return False
+    SD_BREAKER.record_success()
+    log.info("Render log: %s", SD_BREAKER.describe())
+    return True
+
+
+def scene_seed(story_id: str, index: int) -> int:
+    # Fixed per story and scene so re-renders ask SD for (and hit the cache on) the same image
+    digest = hashlib.sha256(f"{story_id}:{index}".encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) & 0x7FFFFFFF
+
+
+_SD_MODEL_MEMO = {"name": None, "at": 0.0}
+_SD_MODEL_LOCK = threading.Lock()
+SD_MODEL_TTL = 300  # seconds between re-reads of the active checkpoint
+
+
+def sd_active_model() -> str:
+    if SD_MODEL:
+        return SD_MODEL
+    if not SD_API or not requests:
+        raise RuntimeError("Stable Diffusion API not configured.")
+    with _SD_MODEL_LOCK:
+        now = time.monotonic()
+        if _SD_MODEL_MEMO["name"] is None or now - _SD_MODEL_MEMO["at"] > SD_MODEL_TTL:
+            r = HTTP.get(f"{SD_API}/sdapi/v1/options", timeout=10)
+            r.raise_for_status()
+            _SD_MODEL_MEMO.update(name=r.json().get("sd_model_checkpoint", ""), at=now)
+        return _SD_MODEL_MEMO["name"]
+
+
+def sd_payload(prompt: str, width: int, height: int, seed: int = -1) -> dict:
+    payload = {"prompt": prompt, "width": width, "height": height, "steps": SD_STEPS,
+               "sampler_index": SD_SAMPLER, "cfg_scale": SD_CFG_SCALE, "seed": seed}
+    if SD_MODEL:
+        payload["override_settings"] = {"sd_model_checkpoint": SD_MODEL}
+    return payload
+
+
+def sd_txt2img_png(payload: dict) -> bytes:
     if not SD_API or not requests:
         raise RuntimeError("Stable Diffusion API not configured.")
-    payload = {"prompt": prompt, "width": width, "height": height, "steps": 25, "sampler_index": "Euler a", "cfg_scale": 6.5}
-    r = requests.post(f"{SD_API}/sdapi/v1/txt2img", json=payload, timeout=180)
+    r = HTTP.post(f"{SD_API}/sdapi/v1/txt2img", json=payload, timeout=SD_TIMEOUT)
     r.raise_for_status()
     data = r.json()
     import base64
     img_b64 = data["images"][0]
-    return Image.open(io.BytesIO(base64.b64decode(img_b64))).convert("RGB")
+    return base64.b64decode(img_b64)
 
 
-def fallback_illustration(prompt: str, width: int, height: int) -> Image.Image:
-    img = Image.new("RGB", (width, height), (255, 252, 246))
+def sd_txt2img_batch_png(payloads: List[dict]) -> List[bytes]:
+    # Several same-size payloads in one request. txt2img's batch_size only varies the seed of a single
+    # prompt, so scenes go through the "Prompts from file or textbox" script instead: one line per
+    # scene with its own prompt and seed, images come back in line order.
+    if not SD_API or not requests:
+        raise RuntimeError("Stable Diffusion API not configured.")
+    lines = "\n".join(f"--prompt {shlex.quote(p['prompt'])} --seed {p['seed']}" for p in payloads)
+    payload = {**payloads[0], "prompt": "", "seed": -1, "script_name": "prompts from file or textbox",
+               "script_args": [False, False, "start", lines]}
+    r = HTTP.post(f"{SD_API}/sdapi/v1/txt2img", json=payload,
+                  timeout=min(SD_TIMEOUT * len(payloads), SD_BATCH_TIMEOUT))
+    r.raise_for_status()
+    images = r.json().get("images") or []
+    if len(images) < len(payloads):
+        raise RuntimeError(f"batch returned {len(images)} of {len(payloads)} images")
+    import base64
+    return [base64.b64decode(img_b64) for img_b64 in images[:len(payloads)]]
+
+
+@lru_cache(maxsize=8)
+def fallback_background(width: int, height: int) -> Image.Image:
+    # Gradient, border and empty bubble are identical for every scene at a given size
+    t = np.arange(height, dtype=np.float64)[:, None] / height
+    column = np.concatenate([255 - 20*t, 250 - 50*t, 240 - 60*t], axis=1).astype(np.uint8)
+    img = Image.fromarray(np.ascontiguousarray(np.broadcast_to(column[:, None, :], (height, width, 3))), "RGB")
     draw = ImageDraw.Draw(img)
-    for y in range(height):
-        t = y / height
-        r = int(255 - 20*t)
-        g = int(250 - 50*t)
-        b = int(240 - 60*t)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
     margin = int(min(width, height) * 0.03)
     draw.rounded_rectangle([margin, margin, width - margin, height - margin], radius=margin, outline=(255, 230, 200), width=6)
+    bx, by, bubble_w, bubble_h = fallback_bubble(width, height)
+    draw.rounded_rectangle([bx, by, bx + bubble_w, by + bubble_h], radius=24, fill=(255, 255, 255, 230), outline=(240, 220, 200), width=4)
+    return img
+
+
+def fallback_bubble(width: int, height: int) -> Tuple[int, int, int, int]:
     bubble_w = int(width * 0.86)
     bubble_h = int(height * 0.18)
-    bx = (width - bubble_w)//2
-    by = int(height * 0.72)
-    draw.rounded_rectangle([bx, by, bx + bubble_w, by + bubble_h], radius=24, fill=(255, 255, 255, 230), outline=(240, 220, 200), width=4)
+    return (width - bubble_w)//2, int(height * 0.72), bubble_w, bubble_h
+
+
+@lru_cache(maxsize=8)
+def fallback_font(size: int):
     try:
-        font = ImageFont.truetype("DejaVuSans.ttf", size=int(bubble_h*0.28))
+        return ImageFont.truetype("DejaVuSans.ttf", size=size)
     except Exception:
-        font = ImageFont.load_default()
+        return ImageFont.load_default()
+
+
+def fallback_illustration(prompt: str, width: int, height: int) -> Image.Image:
+    img = fallback_background(width, height).copy()
+    draw = ImageDraw.Draw(img)
+    bx, by, bubble_w, bubble_h = fallback_bubble(width, height)
+    font = fallback_font(int(bubble_h*0.28))
     text = prompt.split(",")[0][:80]
     tw, th = draw.textlength(text, font=font), font.size
-    tx = bx + (buble_w - tw)//2 if (buble_w:=bubble_w) else bx
+    tx = bx + (bubble_w - tw)//2 if bubble_w else bx
     ty = by + (bubble_h - th)//2
     draw.text((tx, ty), text, fill=(60, 60, 60), font=font)
     return img
 
 
-def make_image(prompt: str, resolution: Tuple[int, int]) -> Image.Image:
+def sd_native_side(model: str) -> int:
+    # Side of the square a checkpoint was trained on, guessed from its name; 0 = draw at output size
+    if SD_NATIVE != "auto":
+        return int(SD_NATIVE)
+    name = model.lower()
+    if any(tag in name for tag in ("xl", "sd3", "flux", "pony")):
+        return 1024
+    if any(tag in name for tag in ("768", "v2-", "sd2", "2.1")):
+        return 768
+    return 512
+
+
+def sd_ladder(resolution: Tuple[int, int], model: str) -> Tuple[int, int]:
+    # Size SD actually draws at: about native² pixels in the output's aspect ratio, in 64 px steps
+    w, h = resolution
+    side = sd_native_side(model)
+    if not side or w * h <= side * side:
+        return resolution
+    scale = side / (w * h) ** 0.5
+    return max(64, round(w * scale / 64) * 64), max(64, round(h * scale / 64) * 64)
+
+
+def sd_extras_upscale_png(png: bytes, resolution: Tuple[int, int], upscaler: str) -> bytes:
+    import base64
     w, h = resolution
+    payload = {"image": base64.b64encode(png).decode(), "resize_mode": 1, "upscaling_resize_w": w,
+               "upscaling_resize_h": h, "upscaling_crop": True, "upscaler_1": upscaler}
+    r = HTTP.post(f"{SD_API}/sdapi/v1/extra-single-image", json=payload, timeout=SD_TIMEOUT)
+    r.raise_for_status()
+    return base64.b64decode(r.json()["image"])
+
+
+def sd_upscale(png: bytes, resolution: Tuple[int, int], key: str) -> Image.Image:
+    # Native-size SD output to `resolution`: Lanczos, or the WebUI's extras upscaler (cached, with
+    # Lanczos as the fallback)
+    if SD_UPSCALER.startswith("extras:"):
+        up_key = SD_CACHE.key(key, SD_UPSCALER, resolution)
+        cached = SD_CACHE.read_bytes(up_key, ".png")
+        if cached:
+            return Image.open(io.BytesIO(cached)).convert("RGB")
+        try:
+            png = sd_extras_upscale_png(png, resolution, SD_UPSCALER.split(":", 1)[1])
+            SD_CACHE.put_bytes(up_key, ".png", png)
+        except Exception as e:
+            log.warning("SD upscaler %s failed (%s); using Lanczos.", SD_UPSCALER, e)
+    img = Image.open(io.BytesIO(png)).convert("RGB")
+    return img if img.size == tuple(resolution) else ImageOps.fit(img, resolution, Image.LANCZOS)
+
+
+def sd_txt2img_pngs(payloads: List[dict]) -> List[bytes]:
+    # One request for all of them when batching works, else one request each. Timeouts and connection
+    # errors propagate, so the caller trips SD_BREAKER. Any HTTP error only disables batching: the WebUI
+    # answers 500 when the script itself fails, and the single requests still trip SD_BREAKER if SD is down.
+    if len(payloads) > 1 and SD_BATCH_BREAKER.allow():
+        try:
+            return sd_txt2img_batch_png(payloads)
+        except (requests.Timeout, requests.ConnectionError):
+            raise
+        except Exception as e:
+            SD_BATCH_BREAKER.record_failure(f"{type(e).__name__}: {e}")
+    return [sd_txt2img_png(payload) for payload in payloads]
+
+
+def sd_images(prompts: List[str], resolution: Tuple[int, int], seeds: List[int],
+              stats: Optional[dict] = None, baseline_px: Optional[int] = None) -> List[Image.Image]:
+    # Cached SD images for several scenes of one size; raises when SD fails. SD draws at sd_ladder()
+    # size and the misses share one request; each result is cached under its own single-scene key.
+    # `stats`, if given, accumulates generation and upscaling time and the estimated time saved against
+    # drawing `baseline_px` pixels per scene at full size (default: `resolution` itself).
+    model = sd_active_model()
+    native = sd_ladder(resolution, model)
+    payloads = [sd_payload(prompt, *native, seed) for prompt, seed in zip(prompts, seeds)]
+    keys = [SD_CACHE.key(model, payload) for payload in payloads]
+    pngs = [SD_CACHE.read_bytes(key, ".png") for key in keys]
+    missing = [j for j, png in enumerate(pngs) if png is None]
+    t0 = time.perf_counter()
+    for j, png in zip(missing, sd_txt2img_pngs([payloads[j] for j in missing])):
+        pngs[j] = png
+        SD_CACHE.put_bytes(keys[j], ".png", png)
+    sd_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    images = [sd_upscale(png, resolution, key) for png, key in zip(pngs, keys)]
+    upscale_s = time.perf_counter() - t0
+    if stats is not None and native != tuple(resolution):
+        ladder = stats.setdefault("sd_ladder", {"native": [], "upscaler": SD_UPSCALER, "generated": 0,
+                                                "sd_s": 0.0, "upscale_s": 0.0, "saved_s": 0.0})
+        if f"{native[0]}x{native[1]}" not in ladder["native"]:
+            ladder["native"].append(f"{native[0]}x{native[1]}")
+        ladder["generated"] += len(missing)
+        ladder["sd_s"] = round(ladder["sd_s"] + sd_s, 3)
+        ladder["upscale_s"] = round(ladder["upscale_s"] + upscale_s, 3)
+        if missing:
+            # SD time grows at least linearly with pixels, so this is a lower bound
+            full = sd_s * (baseline_px or resolution[0] * resolution[1]) / (native[0] * native[1])
+            ladder["saved_s"] = round(ladder["saved_s"] + full - sd_s - upscale_s, 3)
+    return images
+
+
+def make_images(prompts: List[str], resolution: Tuple[int, int], seeds: List[int],
+                use_sd: bool = True, stats: Optional[dict] = None) -> List[Image.Image]:
+    return draw_images(prompts, resolution, seeds, use_sd, stats)[0]
+
+
+def draw_images(prompts: List[str], resolution: Tuple[int, int], seeds: List[int],
+                use_sd: bool = True, stats: Optional[dict] = None) -> Tuple[List[Image.Image], bool]:
+    # make_images, plus whether SD drew them (False: fallback art)
+    if use_sd and SD_API and SD_BREAKER.allow():
+        try:
+            return sd_images(prompts, resolution, seeds, stats), True
+        except Exception as e:
+            SD_BREAKER.record_failure(f"{type(e).__name__}: {e}")
+    if use_sd and SD_API and stats is not None:
+        stats["sd_fallback"] = stats.get("sd_fallback", 0) + len(prompts)
+    return [fallback_illustration(prompt, *resolution) for prompt in prompts], False
+
+
+def uses_master_canvas(resolutions: List[Tuple[int, int]]) -> bool:
+    return MASTER_CANVAS and len({round(w / h, 3) for w, h in resolutions}) > 1
+
+
+def crop_aspect(target: float) -> float:
+    # Aspect of the window cut from a square master: MASTER_PAD moves it from the target's (pure crop)
+    # towards the master's (pure letterbox)
+    return target + MASTER_PAD * (1.0 - target)
+
+
+def master_side(resolutions: List[Tuple[int, int]]) -> int:
+    # Smallest square (in SD's 64 px steps) whose crop window covers every output without upscaling
+    need = 64
+    for w, h in resolutions:
+        aspect = crop_aspect(w / h)
+        need = max(need, w / aspect if aspect < 1 else h * aspect)
+    return int(-(-need // 64) * 64)
+
+
+def saliency_map(img: Image.Image, size: int = 64) -> np.ndarray:
+    # Where the subject probably is: local contrast of a small grey copy, weighted towards the centre.
+    # A flat image falls back to the centre.
+    grey = np.asarray(img.convert("L").resize((size, size), Image.BILINEAR), dtype=np.float32)
+    gy, gx = np.gradient(grey)
+    contrast = np.hypot(gx, gy)
+    contrast /= contrast.mean() + 1e-6
+    yy, xx = np.mgrid[-1:1:size * 1j, -1:1:size * 1j]
+    return (contrast + 0.25) * np.exp(-(xx**2 + yy**2) / 0.5)
+
+
+def derive_frame(master: Image.Image, resolution: Tuple[int, int], saliency: np.ndarray) -> Image.Image:
+    # Cut the most salient window of crop_aspect() from the master, fit it into the frame and pad the
+    # rest with a blurred cover of the master
+    W, H = resolution
+    mw, mh = master.size
+    aspect = crop_aspect(W / H) * mh / mw  # relative to the master's own aspect
+    if aspect < 1:
+        profile, full, window = saliency.sum(axis=0), mw, round(mw * aspect)
+    else:
+        profile, full, window = saliency.sum(axis=1), mh, round(mh / aspect)
+    n = len(profile)
+    span = max(1, round(n * window / full))
+    mass = np.concatenate([[0.0], np.cumsum(profile)])
+    offset = min(full - window, round(int(np.argmax(mass[span:] - mass[:-span])) * full / n))
+    box = (offset, 0, offset + window, mh) if aspect < 1 else (0, offset, mw, offset + window)
+    crop = master.crop(box)
+    scale = min(W / crop.width, H / crop.height)
+    fw, fh = min(W, round(crop.width * scale)), min(H, round(crop.height * scale))
+    crop = crop.resize((fw, fh), Image.LANCZOS)
+    if (fw, fh) == (W, H):
+        return crop
+    frame = ImageOps.fit(master, (max(1, W // 32), max(1, H // 32)), Image.BILINEAR).resize((W, H), Image.BILINEAR)
+    frame.paste(crop, ((W - fw) // 2, (H - fh) // 2))
+    return frame
+
+
+def make_frames(prompts: List[str], seeds: List[int], resolutions: List[Tuple[int, int]],
+                use_sd: bool = True, stats: Optional[dict] = None) -> Tuple[List[List[Image.Image]], List[str]]:
+    # Art for several scenes at every output size, as [scene][size], and where each scene's art came
+    # from ("sd" or "fallback"). With more than one aspect ratio,
+    # SD draws one square master per scene and each size is derived from it; the derived frames are
+    # cached next to the master. `stats` counts images that fell back while SD was wanted (sd_fallback).
+    if not uses_master_canvas(resolutions) or not use_sd or not SD_API or not SD_BREAKER.allow():
+        per_size = [draw_images(prompts, res, seeds, use_sd, stats) for res in resolutions]
+        source = "sd" if all(drawn for _, drawn in per_size) else "fallback"
+        return [list(frames) for frames in zip(*(images for images, _ in per_size))], [source] * len(prompts)
+    side = master_side(resolutions)
     try:
-        return sd_txt2img(prompt, w, h)
-    except Exception:
-        return fallback_illustration(prompt, w, h)
+        model = sd_active_model()
+        frames, keys = [], []
+        for prompt, seed in zip(prompts, seeds):
+            master_key = SD_CACHE.key(model, sd_payload(prompt, *sd_ladder((side, side), model), seed), SD_UPSCALER)
+            keys.append([SD_CACHE.key("frame-v1", master_key, res, MASTER_PAD) for res in resolutions])
+            cached = [SD_CACHE.read_bytes(key, ".png") for key in keys[-1]]
+            frames.append([Image.open(io.BytesIO(png)).convert("RGB") if png else None for png in cached])
+        todo = [j for j, row in enumerate(frames) if None in row]
+        if todo:
+            # Without the master each format would have been drawn on its own at full size
+            masters = sd_images([prompts[j] for j in todo], (side, side), [seeds[j] for j in todo], stats,
+                                baseline_px=sum(w * h for w, h in resolutions))
+            for j, master in zip(todo, masters):
+                saliency = saliency_map(master)
+                for r, res in enumerate(resolutions):
+                    frames[j][r] = derive_frame(master, res, saliency)
+                    if SD_CACHE.enabled:
+                        buf = io.BytesIO()
+                        frames[j][r].save(buf, "PNG", compress_level=1)
+                        SD_CACHE.put_bytes(keys[j][r], ".png", buf.getvalue())
+        return frames, ["sd"] * len(prompts)
+    except Exception as e:
+        SD_BREAKER.record_failure(f"{type(e).__name__}: {e}")
+        if stats is not None:
+            stats["sd_fallback"] = stats.get("sd_fallback", 0) + len(prompts) * len(resolutions)
+        return [[fallback_illustration(prompt, *res) for res in resolutions] for prompt in prompts], \
+            ["fallback"] * len(prompts)
+
+
+def illustrate_scenes(jobs: List[Tuple[int, str, int]], resolutions: List[Tuple[int, int]], workdir: Optional[str],
+                      report: Optional[RunReport] = None, use_sd: bool = True) -> Tuple[List[list], List[str]]:
+    # Art for (scene, prompt, seed) jobs at every resolution, as [scene][resolution]: saved as
+    # workdir/scene_NN_WxH.png and returned as paths, or returned as images when workdir is None.
+    # Also returns each scene's art source, as make_frames.
+    sizes = [f"{w}x{h}" for w, h in resolutions]
+    span = report.span("illustration", scenes=[i for i, _, _ in jobs], resolutions=sizes) if report else nullcontext({})
+    with span as rec:
+        frames, sources = make_frames([prompt for _, prompt, _ in jobs], [seed for _, _, seed in jobs], resolutions,
+                                      use_sd, rec)
+        if "sd_ladder" in rec:
+            rec["sd_ladder"]["saved_s_per_scene"] = round(rec["sd_ladder"]["saved_s"] / len(jobs), 3)
+        if workdir is None:
+            return frames, sources
+        paths = []
+        for (i, _, _), row in zip(jobs, frames):
+            paths.append([os.path.join(workdir, f"scene_{i:02d}_{size}.png") for size in sizes])
+            for img, path in zip(row, paths[-1]):
+                img.save(path)
+        rec["bytes_written"] = sum(os.path.getsize(path) for row in paths for path in row)
+    return paths, sources
 
 # ==============================
 # TTS (all-local options)
@@ -245,11 +1487,97 @@ def tts_pyttsx3(text: str, wav_path: str, voice_hint: str = None, rate_wpm: int
     engine.runAndWait()
 
 
+class PiperWorker:
+    # Long-lived `piper --json-input` process: the voice model is loaded once and each
+    # stdin line {"text", "output_file"} is acknowledged by piper printing the WAV path.
+    def __init__(self, exe: str, voice: str):
+        self.exe = exe
+        self.voice = voice
+        self.proc = None
+        self._stdout = None
+        self._stderr = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            [self.exe, "-m", self.voice, "--json-input"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        self._stdout = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc.stdout, self._stdout.put), daemon=True).start()
+        threading.Thread(target=self._pump, args=(self.proc.stderr, self._stderr.append), daemon=True).start()
+
+    @staticmethod
+    def _pump(stream, sink):
+        for line in stream:
+            sink(line.rstrip("\n"))
+        sink(None)  # EOF: the process exited
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def synthesize(self, text: str, wav_path: str):
+        request = json.dumps({"text": text, "output_file": os.path.abspath(wav_path)}, ensure_ascii=False)
+        if os.path.exists(wav_path):
+            os.remove(wav_path)  # so a stale file from an earlier render never passes as output
+        with self._lock:
+            for _ in range(2):  # restart once if the worker died
+                if not self.alive():
+                    self._start()
+                try:
+                    self.proc.stdin.write(request + "\n")
+                    self.proc.stdin.flush()
+                    ack = self._stdout.get(timeout=PIPER_TIMEOUT)
+                except (OSError, queue.Empty):
+                    ack = None
+                if ack is not None and os.path.exists(wav_path):
+                    return
+                self.close()
+            err = " ".join(line for line in self._stderr if line)
+            raise RuntimeError(f"Piper worker failed: {err}")
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.proc = None
+
+
+_PIPER_WORKERS = {}
+_PIPER_WORKERS_LOCK = threading.Lock()
+
+
+def piper_worker(exe: str, voice: str) -> PiperWorker:
+    with _PIPER_WORKERS_LOCK:
+        worker = _PIPER_WORKERS.get((exe, voice))
+        if worker is None:
+            worker = _PIPER_WORKERS[(exe, voice)] = PiperWorker(exe, voice)
+        return worker
+
+
+@atexit.register
+def _close_piper_workers():
+    with _PIPER_WORKERS_LOCK:
+        for worker in _PIPER_WORKERS.values():
+            worker.close()
+        _PIPER_WORKERS.clear()
+
+
 def tts_piper(text: str, wav_path: str, voice_path: str = None):
     exe = PIPER_PATH
     voice = voice_path or PIPER_VOICE
     if not exe or not voice:
         raise RuntimeError("Piper not configured. Set PIPER_PATH and PIPER_VOICE.")
+    if PIPER_WORKER:
+        return piper_worker(exe, voice).synthesize(text, wav_path)
     # Piper reads text from stdin and writes wav via -w
     with open(wav_path, 'wb') as out:
         proc = subprocess.run([exe, "-m", voice, "-w", wav_path], input=text.encode('utf-8'), stdout=out, stderr=subprocess.PIPE)
@@ -267,53 +1595,1029 @@ def tts_espeak(text: str, wav_path: str, voice: str = None):
         raise RuntimeError(f"eSpeak failed: {proc.stderr.decode('utf-8', 'ignore')}")
 
 
+def tts_voice(engine: str, voice_hint: str = None) -> Optional[str]:
+    return {"Piper (offline)": PIPER_VOICE, "eSpeak (offline)": None}.get(engine, voice_hint)
+
+
 def synthesize(text: str, out_wav: str, engine: str, voice_hint: str = None):
     os.makedirs(os.path.dirname(out_wav), exist_ok=True)
+    key = TTS_CACHE.key(engine, tts_voice(engine, voice_hint), TTS_RATE_WPM, text)
+    if TTS_CACHE.fetch(key, ".wav", out_wav):
+        return
+
     if engine == "Piper (offline)":
-        return tts_piper(text, out_wav)
-    if engine == "eSpeak (offline)":
-        return tts_espeak(text, out_wav)
-    # default
-    return tts_pyttsx3(text, out_wav, voice_hint)
+        tts_piper(text, out_wav)
+    elif engine == "eSpeak (offline)":
+        tts_espeak(text, out_wav)
+    else:
+        # default
+        tts_pyttsx3(text, out_wav, voice_hint, rate_wpm=TTS_RATE_WPM)
+    TTS_CACHE.put(key, ".wav", out_wav)
 
 # ==============================
 # Video assembly
 # ==============================
 
-def build_video(scenes: List[Scene], resolution: Tuple[int, int], out_path: str, voice_hint: str, tts_engine: str) -> str:
-    W, H = resolution
-    workdir = os.path.join(ASSETS_DIR, slugify(os.path.splitext(os.path.basename(out_path))[0]))
-    os.makedirs(workdir, exist_ok=True)
+def audio_duration(wav_path: str) -> float:
+    try:
+        with wave.open(wav_path, "rb") as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except Exception:
+        # not a plain PCM WAV (e.g. pyttsx3 on macOS writes AIFF) — let ffmpeg probe it
+        ac = AudioFileClip(wav_path)
+        try:
+            return ac.duration
+        finally:
+            ac.close()
 
-    clips = []
-    for i, sc in enumerate(scenes, start=1):
-        img = make_image(sc.prompt, (W, H))
-        img_path = os.path.join(workdir, f"scene_{i:02d}.png")
-        img.save(img_path)
 
-        wav_path = os.path.join(workdir, f"scene_{i:02d}.wav")
-        synthesize(sc.text, wav_path, engine=tts_engine, voice_hint=voice_hint)
+def build_narration_track(assets: List[SceneAsset], out_path: str, fps: int = FPS) -> str:
+    # One PCM buffer for the whole story: every scene resampled to AUDIO_RATE stereo, padded or
+    # trimmed to its frame-aligned duration, then encoded to AAC once.
+    wav_path = os.path.splitext(out_path)[0] + ".wav"
+    if AudioSegment is None:
+        cmd = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error"]
+        for a in assets:
+            cmd += ["-i", a.wav_path]
+        run_ffmpeg(cmd + ["-filter_complex", ";".join(narration_filter(assets, 0, ["a"], fps)),
+                          "-map", "[a]", "-c:a", "aac", out_path])
+        return out_path
 
-        ac = AudioFileClip(wav_path)
-        ic = ImageClip(img_path).set_duration(max(sc.duration, ac.duration)).set_audio(ac).resize((W, H))
-        # Gentle Ken Burns
-        zoom_end = 1.05
-        ic = ic.fx(lambda clip: clip.resize(lambda t: 1 + (zoom_end-1) * (t / clip.duration)))
-        clips.append(ic)
-
-    final = concatenate_videoclips(clips, method="compose")
-    final.write_videofile(out_path, fps=FPS, codec="libx264", audio_codec="aac", threads=4, preset="medium")
-    for c in clips:
-        c.close()
-    final.close()
+    parts = []
+    for a in assets:
+        seg = AudioSegment.from_file(a.wav_path).set_frame_rate(AUDIO_RATE).set_channels(2).set_sample_width(2)
+        pcm = np.frombuffer(seg.raw_data, dtype=np.int16).reshape(-1, 2)
+        n = round(scene_frames(a.duration, fps) / fps * AUDIO_RATE)
+        scene = np.zeros((n, 2), dtype=np.int16)
+        scene[:min(n, len(pcm))] = pcm[:n]
+        parts.append(scene)
+    with wave.open(wav_path, "wb") as wf:
+        wf.setnchannels(2)
+        wf.setsampwidth(2)
+        wf.setframerate(AUDIO_RATE)
+        wf.writeframes(np.concatenate(parts).tobytes())
+    try:
+        run_ffmpeg([FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error", "-i", wav_path, "-c:a", "aac", out_path])
+    finally:
+        os.remove(wav_path)
     return out_path
 
+
+def narration_track(targets: List[RenderTarget]) -> str:
+    # Backends call this so targets built without a track (tests, benchmarks) still get one
+    shared = next((t.audio_path for t in targets if t.audio_path), None)
+    if shared is None:
+        shared = build_narration_track(targets[0].assets,
+                                       os.path.join(os.path.dirname(targets[0].assets[0].wav_path),
+                                                    f"narration_{targets[0].fps}fps.m4a"),
+                                       targets[0].fps)
+    for t in targets:
+        t.audio_path = t.audio_path or shared
+    return shared
+
+
+def render_moviepy(targets: List[RenderTarget]) -> List[str]:
+    audio = narration_track(targets)
+    outputs = []
+    for target in targets:
+        W, H = target.resolution
+        clips = []
+        for a in target.assets:
+            ic = ImageClip(a.image_path).set_duration(a.duration).resize((W, H))
+            # Gentle Ken Burns
+            ic = ic.fx(lambda clip: clip.resize(lambda t: 1 + (ZOOM_END-1) * (t / clip.duration)))
+            clips.append(ic)
+
+        final = concatenate_videoclips(clips, method="compose")
+        # A filename as `audio` makes MoviePy mux it with -acodec copy
+        final.write_videofile(target.out_path, fps=target.fps, codec="libx264", audio=audio, threads=4,
+                              preset=target.preset)
+        for c in clips:
+            c.close()
+        final.close()
+        outputs.append(target.out_path)
+    return outputs
+
+
+def kenburns_filter(resolution: Tuple[int, int], frames: int, fps: int = FPS) -> str:
+    W, H = resolution
+    # Upscale the still once (2x) so zoompan's integer crop offsets don't jitter,
+    # then emit every frame of the scene from that single input frame (d=frames).
+    return (
+        f"scale={2*W}:{2*H},setsar=1,"
+        f"zoompan=z='1+{ZOOM_END-1:.4f}*on/{frames}'"
+        f":x='iw/2-iw/zoom/2':y='ih/2-ih/zoom/2'"
+        f":d={frames}:s={W}x{H}:fps={fps},"
+        "format=yuv420p"
+    )
+
+
+def scene_frames(duration: float, fps: int = FPS) -> int:
+    return max(1, round(duration * fps))
+
+
+def x264_args(threads: int = 4, fps: int = FPS, preset: str = "medium") -> List[str]:
+    # Identical for every backend/segment so stream-copied segments concatenate cleanly
+    return ["-r", str(fps), "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-threads", str(threads)]
+
+
+def narration_filter(assets: List[SceneAsset], audio_base: int, outputs: List[str], fps: int = FPS) -> List[str]:
+    # Pad/trim each scene's WAV to its frame-aligned duration and concatenate them into `outputs`
+    n = len(assets)
+    graph = [
+        f"[{audio_base + k}:a]aformat=sample_rates={AUDIO_RATE}:channel_layouts=stereo,"
+        f"apad,atrim=0:{scene_frames(a.duration, fps) / fps:.3f}[a{k}]"
+        for k, a in enumerate(assets)
+    ]
+    concat = "".join(f"[a{k}]" for k in range(n)) + f"concat=n={n}:v=0:a=1"
+    if len(outputs) > 1:
+        concat += f",asplit={len(outputs)}"
+    graph.append(concat + "".join(f"[{label}]" for label in outputs))
+    return graph
+
+
+def run_ffmpeg(cmd: List[str]):
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode('utf-8', 'ignore')}")
+
+
+def render_ffmpeg(targets: List[RenderTarget]) -> List[str]:
+    # One native ffmpeg process for every target: per-scene zoompan per format, each with its
+    # own encoder, and the shared AAC narration stream-copied into every output.
+    audio = narration_track(targets)
+    n = len(targets[0].assets)
+    cmd = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error"]
+    for target in targets:
+        for a in target.assets:
+            cmd += ["-i", a.image_path]
+    audio_input = len(targets) * n
+    cmd += ["-i", audio]
+
+    graph = []
+    for t, target in enumerate(targets):
+        for k, a in enumerate(target.assets):
+            vf = kenburns_filter(target.resolution, scene_frames(a.duration, target.fps), target.fps)
+            graph.append(f"[{t * n + k}:v]{vf}[v_t{t}_{k}]")
+        graph.append("".join(f"[v_t{t}_{k}]" for k in range(n)) + f"concat=n={n}:v=1:a=0[v_t{t}]")
+
+    cmd += ["-filter_complex", ";".join(graph)]
+    for t, target in enumerate(targets):
+        cmd += ["-map", f"[v_t{t}]", "-map", f"{audio_input}:a", *x264_args(fps=target.fps, preset=target.preset),
+                "-c:a", "copy", target.out_path]
+    run_ffmpeg(cmd)
+    return [target.out_path for target in targets]
+
+
+def encode_segment(asset: SceneAsset, target: RenderTarget, seg_path: str, threads: int) -> str:
+    # Video-only, starts on an IDR frame by construction (fresh encoder per segment)
+    vf = kenburns_filter(target.resolution, scene_frames(asset.duration, target.fps), target.fps)
+    run_ffmpeg([FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error", "-i", asset.image_path,
+                "-vf", vf, "-an", *x264_args(threads, target.fps, target.preset), seg_path])
+    return seg_path
+
+
+def concat_segments(segments: List[str], audio_path: str, out_path: str):
+    list_path = os.path.splitext(out_path)[0] + ".segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for seg in segments:
+            escaped = os.path.abspath(seg).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+           "-i", audio_path, "-map", "0:v", "-map", "1:a", "-c", "copy", out_path]
+    try:
+        run_ffmpeg(cmd)
+    finally:
+        os.remove(list_path)
+
+
+def render_segments(targets: List[RenderTarget]) -> List[str]:
+    # Every (format, scene) is its own ffmpeg encode, RENDER_WORKERS at a time, then each
+    # format is joined with the concat demuxer (-c copy) and muxed with the narration.
+    audio = narration_track(targets)
+    jobs = len(targets) * len(targets[0].assets)
+    workers = max(1, min(RENDER_WORKERS, jobs))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        segments = []
+        for target in targets:
+            W, H = target.resolution
+            seg_dir = os.path.join(os.path.dirname(target.assets[0].wav_path), "segments")
+            os.makedirs(seg_dir, exist_ok=True)
+            segments.append([
+                pool.submit(cached_segment, a, target, os.path.join(seg_dir, f"scene_{k:02d}_{W}x{H}.mp4"), threads)
+                for k, a in enumerate(target.assets, start=1)
+            ])
+        for target, futures in zip(targets, segments):
+            concat_segments([f.result() for f in futures], audio, target.out_path)
+    return [target.out_path for target in targets]
+
+
+def cached_segment(asset: SceneAsset, target: RenderTarget, seg_path: str, threads: int) -> str:
+    if asset.segment_path:
+        return asset.segment_path
+    encode_segment(asset, target, seg_path, threads)
+    if asset.segment_key:
+        SEGMENT_CACHE.put(asset.segment_key, ".mp4", seg_path)
+    return seg_path
+
+
+def segment_key(scene: Scene, seed: int, resolution: Tuple[int, int], tts_engine: str, voice_hint: str,
+                art_source: str, profile: RenderProfile = RENDER_PROFILES["final"]) -> str:
+    # Everything that shapes a scene's encoded video; the narration text/voice fix its duration
+    return SEGMENT_CACHE.key(
+        "segment-v1", scene.text, scene.prompt, scene.duration, seed, list(resolution),
+        tts_engine, tts_voice(tts_engine, voice_hint), TTS_RATE_WPM, art_source,
+        profile.fps, ZOOM_END, kenburns_filter(resolution, 1, profile.fps), x264_args(1, profile.fps, profile.preset)[:-2],
+    )
+
+
+class FramePipe:
+    # ffmpeg reading raw rgb24 frames from stdin; the narration track is stream-copied in
+    def __init__(self, resolution: Tuple[int, int], audio_path: str, out_path: str, fps: int = FPS,
+                 preset: str = "medium"):
+        W, H = resolution
+        cmd = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{W}x{H}", "-r", str(fps), "-i", "-",
+               "-i", audio_path, "-map", "0:v", "-map", "1:a", *x264_args(fps=fps, preset=preset), "-c:a", "copy",
+               out_path]
+        self._stderr = tempfile.TemporaryFile()  # a file, so a chatty ffmpeg can never block on a full pipe
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr)
+        self.frames = 0
+        self._error = None  # set by the first close(): "" on success, else ffmpeg's stderr
+
+    def write(self, frame: np.ndarray):
+        # A BrokenPipeError means ffmpeg has exited; close() (in the caller's finally) raises its error
+        self.proc.stdin.write(memoryview(frame))  # C-contiguous buffer, written without a copy
+        self.frames += 1
+
+    def close(self):
+        # Idempotent: later calls repeat the first outcome
+        if self._error is None:
+            if self.proc.stdin and not self.proc.stdin.closed:
+                try:
+                    self.proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            rc = self.proc.wait()
+            self._stderr.seek(0)
+            err = self._stderr.read().decode("utf-8", "ignore")
+            self._stderr.close()
+            self._error = "" if rc == 0 else err or f"exit code {rc}"
+        if self._error:
+            raise RuntimeError(f"ffmpeg failed: {self._error}")
+
+
+def kenburns_frames(image: Image.Image, resolution: Tuple[int, int], frames: int, out: np.ndarray):
+    # Centered 1.0 → ZOOM_END zoom, sampled from a 2x supersampled copy of the still through
+    # per-frame row/column index maps; every frame is written into the same `out` buffer.
+    W, H = resolution
+    src = np.asarray(image.convert("RGB").resize((2*W, 2*H), Image.BICUBIC))
+    rows_buf = np.empty((H, 2*W, 3), dtype=np.uint8)
+    ys = np.arange(H) + 0.5 - H / 2
+    xs = np.arange(W) + 0.5 - W / 2
+    for f in range(frames):
+        z = 1 + (ZOOM_END - 1) * f / frames
+        rows = np.clip((2 * (H / 2 + ys / z)).astype(np.intp), 0, 2*H - 1)
+        cols = np.clip((2 * (W / 2 + xs / z)).astype(np.intp), 0, 2*W - 1)
+        np.take(src, rows, axis=0, out=rows_buf)
+        np.take(rows_buf, cols, axis=1, out=out)
+        yield out
+
+
+def index_runs(idx: np.ndarray) -> Tuple[Tuple[int, int, int], ...]:
+    # (dst, src, length) for each stretch of consecutive source indices
+    breaks = np.flatnonzero(np.diff(idx) != 1) + 1
+    starts, ends = np.concatenate(([0], breaks)), np.concatenate((breaks, [len(idx)]))
+    return tuple((int(a), int(idx[a]), int(b - a)) for a, b in zip(starts, ends))
+
+
+@lru_cache(maxsize=16)
+def crop_table(resolution: Tuple[int, int], frames: int) -> tuple:
+    # Per frame: the source rows and the column runs, in the ZOOM_END-oversampled source, that yield
+    # that frame. It depends only on the size and frame count (the frame rate is already in `frames`).
+    # Windows are snapped to whole source pixels, so a frame is one row gather plus a few dozen
+    # column slices (one at ZOOM_END, where the window is the W x H centre of the source).
+    W, H = resolution
+    Sw, Sh = round(W * ZOOM_END), round(H * ZOOM_END)
+    ys = np.arange(H) + 0.5 - H / 2
+    xs = np.arange(W) + 0.5 - W / 2
+    table = []
+    for f in range(frames):
+        s = ZOOM_END / (1 + (ZOOM_END - 1) * f / frames)  # source pixels per output pixel
+        rows = np.clip(np.floor(Sh / 2 + ys * s), 0, Sh - 1).astype(np.int32)
+        rows.setflags(write=False)  # shared by every render of this size
+        cols = np.clip(np.floor(Sw / 2 + xs * s), 0, Sw - 1).astype(np.intp)
+        table.append((rows, index_runs(cols)))
+    return tuple(table)
+
+
+def kenburns_crop_frames(image: Image.Image, resolution: Tuple[int, int], frames: int, out: np.ndarray):
+    # Oversample the still once at ZOOM_END; each frame is a crop window of that source, copied as
+    # a row gather and whole-column slices instead of resampled.
+    W, H = resolution
+    Sw, Sh = round(W * ZOOM_END), round(H * ZOOM_END)
+    src = np.asarray(image.convert("RGB").resize((Sw, Sh), Image.BICUBIC))
+    rows_buf = np.empty((H, Sw, 3), dtype=np.uint8)
+    for rows, runs in crop_table(resolution, frames):
+        np.take(src, rows, axis=0, out=rows_buf)
+        for dst, col, n in runs:
+            out[:, dst:dst + n] = rows_buf[:, col:col + n]
+        yield out
+
+
+def render_pipe(targets: List[RenderTarget], frame_source=kenburns_frames) -> List[str]:
+    # Frames are produced in NumPy and streamed to ffmpeg's stdin; illustrations arrive in memory.
+    audio = narration_track(targets)
+    for target in targets:
+        W, H = target.resolution
+        frame = np.empty((H, W, 3), dtype=np.uint8)
+        pipe = FramePipe(target.resolution, audio, target.out_path, target.fps, target.preset)
+        try:
+            for a in target.assets:
+                image = a.image if a.image is not None else Image.open(a.image_path)
+                for buf in frame_source(image, target.resolution, scene_frames(a.duration, target.fps), frame):
+                    pipe.write(buf)
+        finally:
+            pipe.close()
+    return [target.out_path for target in targets]
+
+
+RENDER_BACKENDS = {
+    "MoviePy (classic)": render_moviepy,
+    "ffmpeg (fast, native)": render_ffmpeg,
+    "ffmpeg (parallel scenes)": render_segments,
+    "ffmpeg pipe (NumPy frames)": render_pipe,
+    "ffmpeg pipe (crop windows)": partial(render_pipe, frame_source=kenburns_crop_frames),
+}
+# Backends that take SceneAsset.image instead of a PNG path
+IN_MEMORY_BACKENDS = {RENDER_BACKENDS["ffmpeg pipe (NumPy frames)"], RENDER_BACKENDS["ffmpeg pipe (crop windows)"]}
+
+
+def job_workdir(label: str) -> str:
+    # Private to one render (narration WAVs, scene PNGs, segments): concurrent jobs for the same
+    # story never share files. WORK_ROOT may be a tmpfs; outputs are published to their own dir.
+    os.makedirs(WORK_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{slugify(label)[:40] or 'job'}-", dir=WORK_ROOT)
+
+
+def adopt_narration(narration: List[Tuple[str, float]], workdir: str) -> Optional[List[Tuple[str, float]]]:
+    # Copy a draft's narration into this job's workdir; None if the sweeper already removed it
+    if not all(os.path.exists(wav_path) for wav_path, _ in narration):
+        log.info("Draft narration is gone from %s; narrating again.", os.path.dirname(narration[0][0]))
+        return None
+    adopted = []
+    for wav_path, duration in narration:
+        dst = os.path.join(workdir, os.path.basename(wav_path))
+        shutil.copyfile(wav_path, dst)
+        adopted.append((dst, duration))
+    return adopted
+
+
+def partial_path(out_path: str) -> str:
+    # Hidden sibling of the final file (same filesystem, so os.replace is atomic); the sweeper ignores
+    # fresh ones and removes abandoned ones
+    folder, name = os.path.split(out_path)
+    return os.path.join(folder, f".{os.getpid()}-{threading.get_ident()}.{name}")
+
+
+def narrate_scene(index: int, scene: Scene, workdir: str, tts_engine: str, voice_hint: str,
+                  report: Optional[RunReport] = None) -> Tuple[str, float]:
+    wav_path = os.path.join(workdir, f"scene_{index:02d}.wav")
+    with (report.span("narration", scene=index) if report else nullcontext({})) as rec:
+        synthesize(scene.text, wav_path, engine=tts_engine, voice_hint=voice_hint)
+        rec["bytes_written"] = os.path.getsize(wav_path)
+    return wav_path, max(scene.duration, audio_duration(wav_path))
+
+
+def narrate_scenes(scenes, workdir: str, tts_engine: str, voice_hint: str,
+                   report: Optional[RunReport] = None) -> List[Tuple[str, float]]:
+    # Narration and scene timing are shared by every format and profile; only the art depends on the resolution.
+    return [narrate_scene(i, sc, workdir, tts_engine, voice_hint, report) for i, sc in enumerate(scenes, start=1)]
+
+
+def build_videos(scenes: List[Scene], targets: List[Tuple[Tuple[int, int], str]], voice_hint: str, tts_engine: str,
+                 render_engine: str = "MoviePy (classic)", story_id: Optional[str] = None,
+                 report: Optional[RunReport] = None, profile: str = "final",
+                 narration: Optional[List[Tuple[str, float]]] = None, workdir: Optional[str] = None) -> List[str]:
+    # `targets` are always the final (full-size) outputs; the profile derives its own sizes and names from them.
+    # Pass `narration` (WAVs in `workdir`) to reuse a draft's narration and timing; the caller records whether
+    # that narration was reused (report meta narration_reused). Without a `workdir`, a private one is created
+    # and removed afterwards. Outputs appear atomically once fully written.
+    if render_engine not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render engine: {render_engine}")
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile}")
+    if not targets:
+        return []
+    stems = [os.path.splitext(os.path.basename(path))[0] for _, path in targets]
+    story_id = story_id or slugify(os.path.commonprefix(stems)) or slugify(stems[0])
+    if workdir is None:
+        workdir = job_workdir(story_id)
+        try:
+            return build_videos(scenes, targets, voice_hint, tts_engine, render_engine, story_id, report, profile,
+                                narration, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    prof = RENDER_PROFILES[profile]
+    targets = [(prof.resolution(res), prof.out_path(path)) for res, path in targets]
+    report = report if report is not None else RunReport()
+    report.meta.update(story_id=story_id, tts_engine=tts_engine, render_engine=render_engine,
+                       profile=asdict(prof),
+                       targets=[{"resolution": f"{w}x{h}", "path": path} for (w, h), path in targets])
+    use_sd = bool(SD_API) and prof.sd_art
+    if use_sd:
+        with report.span("sd_probe") as rec:
+            rec["available"] = sd_health_check()
+            rec["breaker"] = SD_BREAKER.describe()
+
+    # Segment-based rendering can skip unchanged scenes entirely (art, and later encode)
+    segments = {}
+    art_source = None
+    if RENDER_BACKENDS[render_engine] is render_segments and SEGMENT_CACHE.enabled:
+        art_source = "fallback"
+        if use_sd and SD_BREAKER.allow():
+            # The ladder settings change the pixels as much as the model does
+            art_source = f"sd:{sd_active_model()}:{SD_NATIVE}:{SD_UPSCALER}"
+        if art_source != "fallback" and uses_master_canvas([res for res, _ in targets]):
+            art_source += f":master{MASTER_PAD}"
+
+    in_memory = RENDER_BACKENDS[render_engine] in IN_MEMORY_BACKENDS
+    with ThreadPoolExecutor(max_workers=max(1, SD_CONCURRENCY)) as pool:
+        images = {}  # (W, H, scene) -> (future of illustrate_scenes, scene row, resolution column)
+        pending = {}  # resolutions -> (scene, prompt, seed) jobs not yet submitted, when batching
+
+        def submit_art(jobs: List[Tuple[int, str, int]], sizes: List[Tuple[int, int]]):
+            future = pool.submit(illustrate_scenes, jobs, sizes, None if in_memory else workdir, report, use_sd)
+            for row, (i, _, _) in enumerate(jobs):
+                for col, (W, H) in enumerate(sizes):
+                    images[(W, H, i)] = (future, row, col)
+
+        def queue_art(i: int, sc: Scene, batch: bool = False):
+            sizes = []
+            for (W, H), _ in targets:
+                if art_source:
+                    key = segment_key(sc, scene_seed(story_id, i), (W, H), tts_engine, voice_hint, art_source, prof)
+                    cached = SEGMENT_CACHE.fetch(key, ".mp4", os.path.join(workdir, f"cached_{i:02d}_{W}x{H}.mp4"))
+                    segments[(W, H, i)] = (key, cached)
+                    if segments[(W, H, i)][1]:
+                        continue
+                sizes.append((W, H))
+            if not sizes:
+                return
+            if art_source and art_source.endswith(f":master{MASTER_PAD}"):
+                # Every size or none: a lone missing size would be drawn without the master canvas, so it
+                # would match neither its key nor the other format's cached segment
+                sizes = [res for res, _ in targets]
+            job = (i, sc.prompt, scene_seed(story_id, i))
+            if batch:
+                pending.setdefault(tuple(sizes), []).append(job)
+            else:
+                submit_art([job], sizes)
+
+        # A list is known up front: queue every illustration first so the SD server stays busy while
+        # narration is synthesized, SD_BATCH scenes per request. A StoryStream is taken scene by
+        # scene, as the LLM finishes each one.
+        streaming = not isinstance(scenes, list)
+        if not streaming:
+            batch = use_sd and SD_BATCH > 1
+            for i, sc in enumerate(scenes, start=1):
+                queue_art(i, sc, batch)
+            for sizes, jobs in pending.items():
+                for start in range(0, len(jobs), SD_BATCH):
+                    submit_art(jobs[start:start + SD_BATCH], list(sizes))
+        story, synthesized = [], []
+        for i, sc in enumerate(scenes, start=1):
+            story.append(sc)
+            if streaming:
+                queue_art(i, sc)
+            if narration is None:
+                synthesized.append(narrate_scene(i, sc, workdir, tts_engine, voice_hint, report))
+        scenes = story
+        narration = synthesized if narration is None else narration
+        report.meta["scenes"] = len(scenes)
+
+        report.meta["output_seconds"] = round(sum(duration for _, duration in narration), 3)
+        render_targets = []
+        with report.span("illustration_wait"):
+            for (W, H), out_path in targets:
+                assets = []
+                for i, (wav_path, duration) in enumerate(narration, start=1):
+                    key, cached = segments.get((W, H, i), (None, None))
+                    image = None
+                    if (W, H, i) in images:
+                        future, row, col = images[(W, H, i)]
+                        art, sources = future.result()
+                        image = art[row][col]
+                        if sources[row] != "sd" and art_source != "fallback":
+                            # SD failed mid-render: never cache placeholder art under the SD key, nor mix
+                            # it with a cached SD segment of the same scene in another format
+                            key, cached = None, None
+                    if in_memory:
+                        assets.append(SceneAsset(None, wav_path, duration, image=image))
+                    else:
+                        assets.append(SceneAsset(image, wav_path, duration, segment_key=key, segment_path=cached))
+                render_targets.append(RenderTarget((W, H), partial_path(out_path), assets, fps=prof.fps,
+                                                   preset=prof.preset))
+        if use_sd:
+            # The breaker may trip mid-render; record where it ended up and what it cost
+            fallback = sum(rec.get("sd_fallback", 0) for rec in report.spans if rec["stage"] == "illustration")
+            report.meta["sd"] = {"breaker": SD_BREAKER.describe(), "fallback_images": fallback}
+        ladders = [rec["sd_ladder"] for rec in report.spans if rec["stage"] == "illustration" and "sd_ladder" in rec]
+        if ladders:
+            saved = sum(ladder["saved_s"] for ladder in ladders)
+            report.meta["sd_ladder"] = {"native": sorted({size for ladder in ladders for size in ladder["native"]}),
+                                        "upscaler": SD_UPSCALER, "saved_s": round(saved, 3),
+                                        "saved_s_per_scene": round(saved / max(1, len(scenes)), 3)}
+        with report.span("narration_track") as rec:
+            audio = build_narration_track(render_targets[0].assets,
+                                          os.path.join(workdir, f"narration{prof.suffix}.m4a"), prof.fps)
+            rec["bytes_written"] = os.path.getsize(audio)
+        for target in render_targets:
+            target.audio_path = audio
+        if segments:
+            # A segment is one scene in one format; a scene counts as reused when every format's segment was
+            reused = [[a.segment_path is not None for a in target.assets] for target in render_targets]
+            report.meta.update(segments_reused=sum(map(sum, reused)),
+                               segments_encoded=sum(len(row) - sum(row) for row in reused),
+                               scenes_reused=sum(map(all, zip(*reused))))
+
+    try:
+        with report.span("render", engine=render_engine, profile=profile) as rec:
+            partials = RENDER_BACKENDS[render_engine](render_targets)
+            rec["bytes_written"] = sum(os.path.getsize(p) for p in partials)
+        outputs = [out_path for _, out_path in targets]
+        for tmp, out in zip(partials, outputs):
+            os.replace(tmp, out)
+    finally:
+        for target in render_targets:
+            if os.path.exists(target.out_path):
+                os.remove(target.out_path)
+    for out in outputs:
+        report.write(report_path(out))
+    return outputs
+
+
+def build_video(scenes: List[Scene], resolution: Tuple[int, int], out_path: str, voice_hint: str, tts_engine: str,
+                render_engine: str = "MoviePy (classic)", story_id: Optional[str] = None,
+                report: Optional[RunReport] = None, profile: str = "final") -> str:
+    return build_videos(scenes, [(resolution, out_path)], voice_hint, tts_engine, render_engine, story_id, report,
+                        profile)[0]
+
+# ==============================
+# Headless pipeline (batch CLI: python -m app)
+# ==============================
+
+FORMATS = {
+    "instagram": (INSTAGRAM_RES, "IG_9x16"),
+    "youtube": (YOUTUBE_RES, "YT_16x9"),
+}
+
+
+@dataclass
+class StorySpec:
+    title: str = "Mina and the Moon Kite"
+    age: int = 5
+    theme: str = "kindness and sky adventures"
+    moral: str = "kindness"
+    minutes: int = 2
+    scenes: int = 8
+    story_engine: str = STORY_ENGINES[0]
+    ollama_model: str = OLLAMA_MODEL
+    tts_engine: str = TTS_ENGINES[0]
+    voice_hint: str = ""
+    render_engine: str = "MoviePy (classic)"
+    formats: List[str] = field(default_factory=lambda: list(FORMATS))
+    profile: str = "final"
+    variation: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StorySpec":
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown story spec keys: {', '.join(sorted(unknown))}")
+        spec = cls(**data)
+        for name, allowed in (("story_engine", STORY_ENGINES), ("tts_engine", TTS_ENGINES),
+                              ("render_engine", list(RENDER_BACKENDS)), ("profile", list(RENDER_PROFILES))):
+            if getattr(spec, name) not in allowed:
+                raise ValueError(f"{name} must be one of {allowed}")
+        bad = [f for f in spec.formats if f not in FORMATS]
+        if bad or not spec.formats:
+            raise ValueError(f"formats must be a non-empty subset of {list(FORMATS)}")
+        return spec
+
+
+def load_specs(path: str) -> List[StorySpec]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        items = data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [StorySpec.from_dict(item) for item in items]
+
+
+def story_targets(story_title: str, formats: List[str], out_dir: str = ASSETS_DIR) -> List[Tuple[Tuple[int, int], str]]:
+    # Timestamp + random tag: two jobs for the same title never publish over each other
+    tag = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.urandom(2).hex()}"
+    return [(FORMATS[f][0], os.path.join(out_dir, f"{slugify(story_title)}_{tag}_{FORMATS[f][1]}.mp4"))
+            for f in formats]
+
+
+def write_story(spec: StorySpec, metrics: Optional[dict] = None) -> Tuple[str, List[Scene]]:
+    if spec.story_engine == "Ollama (local LLM)":
+        try:
+            return generate_story_ollama(spec.title, spec.age, spec.theme, spec.moral, spec.minutes, spec.scenes,
+                                         model=spec.ollama_model, metrics=metrics, variation=spec.variation)
+        except Exception as e:
+            log.warning("Ollama failed (%s). Falling back to built-in.", e)
+    return generate_story_rule_based(spec.title, spec.age, spec.theme, spec.moral, spec.minutes, spec.scenes)
+
+
+def render_story(spec: StorySpec, out_dir: str = ASSETS_DIR, on_update=None, draft: Optional[dict] = None) -> dict:
+    # `draft` is the "draft" entry of an earlier draft render's result: its story, narration and timing are reused
+    report = RunReport(on_update=on_update, story_engine=spec.story_engine)
+    if spec.story_engine == "Ollama (local LLM)" and not draft:
+        report.meta["ollama"] = {"model": spec.ollama_model, "variation": spec.variation,
+                                 **OLLAMA_PROFILE.request_fields(spec.scenes)}
+    narration = None
+    if draft:
+        story_title, scenes, narration = draft["title"], [Scene(**sc) for sc in draft["scenes"]], draft["narration"]
+    elif spec.story_engine == "Ollama (local LLM)" and OLLAMA_STREAM:
+        # Art and narration start on each scene as the LLM finishes it; only the title is waited for
+        scenes = stream_story_ollama(spec.title, spec.age, spec.theme, spec.moral, spec.minutes, spec.scenes,
+                                     model=spec.ollama_model, metrics=report.meta["ollama"],
+                                     variation=spec.variation)
+        report.meta["story_stream"] = scenes.stats
+        with report.span("story", engine=spec.story_engine, streamed=True):
+            story_title = scenes.wait_title()
+    else:
+        with report.span("story", engine=spec.story_engine):
+            story_title, scenes = write_story(spec, report.meta.get("ollama"))
+    os.makedirs(out_dir, exist_ok=True)
+    targets = story_targets(story_title, spec.formats, out_dir)
+    workdir = job_workdir(story_title)
+    try:
+        if narration is not None:
+            narration = adopt_narration(narration, workdir)
+        report.meta["narration_reused"] = narration is not None  # only a draft's narration can be adopted here
+        if spec.profile == "draft" and narration is None:
+            narration = narrate_scenes(scenes, workdir, spec.tts_engine, spec.voice_hint, report)
+            scenes = list(scenes.scenes if isinstance(scenes, StoryStream) else scenes)
+        outputs = build_videos(scenes, targets, spec.voice_hint, spec.tts_engine,
+                               render_engine=spec.render_engine, story_id=slugify(story_title), report=report,
+                               profile=spec.profile, narration=narration, workdir=workdir)
+    finally:
+        # A draft's WAVs stay for its final render (the sweeper expires them); everything else goes now
+        keep = {wav_path for wav_path, _ in narration or []} if spec.profile == "draft" else set()
+        for name in os.listdir(workdir):
+            path = os.path.join(workdir, name)
+            if path in keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        if not keep:
+            os.rmdir(workdir)
+    summary = report.to_dict()
+    result = {
+        "title": story_title,
+        "profile": spec.profile,
+        "outputs": outputs,
+        "reports": [report_path(p) for p in outputs],
+        "output_seconds": summary["output_seconds"],
+        "wall_s": summary["wall_s"],
+        "cpu_s": summary["cpu_s"],
+        **run_figures(report),
+    }
+    if spec.profile == "draft":
+        result["draft"] = {"title": story_title, "scenes": [asdict(sc) for sc in scenes], "narration": narration}
+    return result
+
+def tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def newest_mtime(path: str) -> float:
+    newest = os.path.getmtime(path)
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(dirpath, name)))
+            except OSError:
+                pass
+    return newest
+
+
+def sweep_outputs(out_dir: str = ASSETS_DIR) -> dict:
+    # Expire scratch dirs and partial files after WORK_RETENTION_H, videos (with their run reports) after
+    # OUTPUT_RETENTION_DAYS, then delete the oldest videos until everything fits in OUTPUT_QUOTA_MB.
+    # Caches are bounded separately (*_CACHE_MB) and not counted here.
+    now = time.time()
+    swept = {"workdirs": 0, "partials": 0, "videos": 0, "bytes_freed": 0}
+    scratch = []
+    if os.path.isdir(WORK_ROOT):
+        for name in os.listdir(WORK_ROOT):
+            path = os.path.join(WORK_ROOT, name)
+            size = tree_size(path)
+            if now - newest_mtime(path) > WORK_RETENTION_H * 3600:
+                shutil.rmtree(path, ignore_errors=True)
+                swept["workdirs"] += 1
+                swept["bytes_freed"] += size
+            else:
+                scratch.append(size)
+
+    videos = []
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if not os.path.isfile(path) or not name.endswith(".mp4"):
+            continue
+        info = os.stat(path)
+        if name.startswith("."):
+            if now - info.st_mtime > WORK_RETENTION_H * 3600:
+                os.remove(path)
+                swept["partials"] += 1
+                swept["bytes_freed"] += info.st_size
+            continue
+        report = report_path(path)
+        size = info.st_size + (os.path.getsize(report) if os.path.exists(report) else 0)
+        videos.append((info.st_mtime, size, path))
+
+    total = sum(scratch) + sum(size for _, size, _ in videos)
+    for mtime, size, path in sorted(videos):
+        expired = OUTPUT_RETENTION_DAYS > 0 and now - mtime > OUTPUT_RETENTION_DAYS * 86400
+        if not expired and (OUTPUT_QUOTA_MB <= 0 or total <= OUTPUT_QUOTA_MB * 1024 * 1024):
+            continue
+        for victim in (path, report_path(path)):
+            if os.path.exists(victim):
+                os.remove(victim)
+        swept["videos"] += 1
+        swept["bytes_freed"] += size
+        total -= size
+    swept["bytes_kept"] = total
+    return swept
+
+# ==============================
+# Job queue (SQLite, served by `python -m app worker`)
+# ==============================
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    # One SQLite file shared by the Streamlit UI (submit/poll) and any number of worker processes.
+    # A worker heartbeats while it renders; jobs held by a worker silent for WORKER_STALE are requeued.
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    spec TEXT NOT NULL,
+                    draft TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    worker TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    videos INTEGER NOT NULL DEFAULT 0,
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+                CREATE TABLE IF NOT EXISTS workers (
+                    name TEXT PRIMARY KEY,
+                    started_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                );
+            """)
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # autocommit; claim() opens its own txn
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, spec: StorySpec, draft: Optional[dict] = None) -> int:
+        with self._db() as db:
+            cur = db.execute("INSERT INTO jobs (spec, draft, submitted_at) VALUES (?, ?, ?)",
+                             (json.dumps(asdict(spec)), json.dumps(draft) if draft else None, time.time()))
+            return cur.lastrowid
+
+    def register(self, worker: str):
+        now = time.time()
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO workers (name, started_at, heartbeat_at) VALUES (?, ?, ?)",
+                       (worker, now, now))
+
+    def heartbeat(self, worker: str, alive: bool = True):
+        # alive=False on a clean exit: the worker stops counting as alive and anything it held is requeued
+        with self._db() as db:
+            db.execute("UPDATE workers SET heartbeat_at = ? WHERE name = ?", (time.time() if alive else 0, worker))
+
+    def claim(self, worker: str) -> Optional[Tuple[int, StorySpec, Optional[dict]]]:
+        now = time.time()
+        with self._db() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("""UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL, progress = NULL
+                              WHERE status = 'running' AND worker NOT IN
+                                  (SELECT name FROM workers WHERE heartbeat_at >= ?)""", (now - WORKER_STALE,))
+                row = db.execute("SELECT id, spec, draft FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row:
+                    db.execute("UPDATE jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ?",
+                               (worker, now, row["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        return row["id"], StorySpec.from_dict(json.loads(row["spec"])), json.loads(row["draft"]) if row["draft"] else None
+
+    # progress() and finish() only write while `worker` still holds the job: a worker that stalled past
+    # WORKER_STALE may wake up after claim() handed its job to another. They return False when ignored.
+    def progress(self, job_id: int, worker: str, progress: dict) -> bool:
+        with self._db() as db:
+            cur = db.execute("UPDATE jobs SET progress = ? WHERE id = ? AND worker = ?",
+                             (json.dumps(progress), job_id, worker))
+            return cur.rowcount > 0
+
+    def finish(self, job_id: int, worker: str, result: dict) -> bool:
+        ok = result.get("status", "ok") == "ok"
+        with self._db() as db:
+            cur = db.execute("""UPDATE jobs SET status = ?, result = ?, error = ?, videos = ?, finished_at = ?
+                                WHERE id = ? AND worker = ?""",
+                             ("done" if ok else "failed", json.dumps(result), result.get("error"),
+                              len(result.get("outputs", [])), time.time(), job_id, worker))
+            return cur.rowcount > 0
+
+    def position(self, job_id: int) -> int:
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND id <= ?", (job_id,)).fetchone()[0]
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._db() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def recent(self, limit: int = 20) -> List[dict]:
+        with self._db() as db:
+            rows = db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    @staticmethod
+    def _job(row) -> dict:
+        job = dict(row)
+        for key in ("spec", "draft", "progress", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def stats(self, window: int = 50) -> dict:
+        # Depth and waits over the queue; throughput per worker over the jobs it finished
+        now = time.time()
+        with self._db() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = db.execute("SELECT MIN(submitted_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            waits = [r[0] for r in db.execute(
+                "SELECT started_at - submitted_at FROM jobs WHERE started_at IS NOT NULL ORDER BY id DESC LIMIT ?",
+                (window,))]
+            workers = db.execute("""
+                SELECT w.name, w.started_at, w.heartbeat_at,
+                       SUM(j.status = 'done') AS done, SUM(j.status = 'failed') AS failed,
+                       COALESCE(SUM(j.videos), 0) AS videos,
+                       COALESCE(SUM(j.finished_at - j.started_at), 0) AS busy_s,
+                       MAX(CASE WHEN j.status = 'running' THEN j.id END) AS current_job
+                FROM workers w LEFT JOIN jobs j ON j.worker = w.name
+                GROUP BY w.name ORDER BY w.started_at""").fetchall()
+        return {
+            "depth": counts.get("queued", 0),
+            **{status: counts.get(status, 0) for status in JOB_STATUSES[1:]},
+            "oldest_wait_s": round(now - oldest, 1) if oldest else 0.0,
+            "mean_wait_s": round(sum(waits) / len(waits), 1) if waits else 0.0,
+            "workers": [{
+                "name": w["name"],
+                "alive": now - w["heartbeat_at"] < WORKER_STALE,
+                "current_job": w["current_job"],
+                "done": w["done"] or 0,
+                "failed": w["failed"] or 0,
+                "videos": w["videos"],
+                "busy_s": round(w["busy_s"], 1),
+                "videos_per_hour": round(w["videos"] / w["busy_s"] * 3600, 1) if w["busy_s"] else 0.0,
+            } for w in workers],
+        }
+
+
+def job_progress(report: RunReport) -> dict:
+    # What a worker publishes after each finished span: the latest stage plus the figures show_job renders
+    last = report.spans[-1]["stage"] if report.spans else None
+    return {"last_stage": last, "scenes": report.meta.get("scenes"), **run_figures(report)}
+
+
+@lru_cache(maxsize=None)
+def job_queue(path: str = JOBS_DB) -> JobQueue:
+    # Opened on first use, so importing the module (CLI, benchmarks) never creates the database
+    return JobQueue(path)
+
 # ==============================
 # Streamlit UI
 # ==============================
 
+def show_breakdown(st, figures: dict):
+    # figures: run_figures() as published in a job's progress or result
+    stages = figures.get("stages") or {}
+    if stages:
+        st.table([
+            {"stage": stage, "count": agg["count"], "wall s": round(agg["wall_s"], 2), "cpu s": round(agg["cpu_s"], 2),
+             "MB written": round(agg["bytes_written"] / 1e6, 2), "cache hits": agg["cache_hits"]}
+            for stage, agg in stages.items()
+        ])
+    if figures.get("sd_breaker"):
+        st.caption(f"Illustrations — {figures['sd_breaker']}")
+    caches = figures.get("caches") or {}
+    if caches:
+        tts, sd = caches.get("tts", {}), caches.get("sd", {})
+        st.caption(f"Narration cache: {tts.get('hits', 0)} hits / {tts.get('misses', 0)} misses · "
+                   f"Illustration cache: {sd.get('hits', 0)} hits / {sd.get('misses', 0)} misses")
+    segments = figures.get("segments")
+    if segments:
+        st.caption(f"Scenes reused from earlier renders: {segments['scenes_reused']} of {segments['scenes']} · "
+                   f"segments (scene × format) reused: {segments['reused']}, re-encoded: {segments['encoded']}")
+    if figures.get("http"):
+        st.caption(" · ".join(f"{name}: {e['count']}× avg {e['mean_s']:.2f}s, max {e['max_s']:.2f}s"
+                              for name, e in figures["http"].items()))
+
+
+def show_job(st, job: dict):
+    spec, progress, result = job["spec"], job["progress"] or {}, job["result"] or {}
+    label = f"Job {job['id']} · {spec['title']} · {spec['profile']}"
+    if job["status"] == "queued":
+        st.info(f"{label}: queued for {time.time() - job['submitted_at']:.0f}s (position {job_queue().position(job['id'])})")
+        if not any(w["alive"] for w in job_queue().stats()["workers"]):
+            st.warning("No worker is running. Start one with `python -m app worker`.")
+    elif job["status"] == "running":
+        last = progress.get("last_stage")
+        st.info(f"{label}: running on {job['worker']} for {time.time() - job['started_at']:.0f}s"
+                + (f" — last finished: {last}" if last else ""))
+        show_breakdown(st, progress)
+    elif job["status"] == "failed":
+        st.error(f"{label} failed: {job['error']}")
+    else:
+        st.success(f"{label}: done in {job['finished_at'] - job['started_at']:.0f}s "
+                   f"(waited {job['started_at'] - job['submitted_at']:.0f}s)")
+        draft = result.get("draft")
+        if draft:
+            with st.expander("Preview Story Text"):
+                for i, sc in enumerate(draft["scenes"], start=1):
+                    st.markdown(f"**Scene {i}.** {sc['text']}")
+        for out in result.get("outputs", []):
+            st.video(out)
+            st.write(f"📁 {os.path.abspath(out)}")
+        show_breakdown(st, result)
+        if result.get("reports"):
+            st.caption(f"Run report: {os.path.abspath(result['reports'][0])}")
+        if draft and st.button("Render final video from this draft", key=f"final_from_draft_{job['id']}"):
+            # Same story, narration and timing; only the art and encode are redone at full size
+            final = StorySpec.from_dict({**spec, "profile": "final"})
+            st.query_params["job"] = str(job_queue().submit(final, draft=draft))
+            st.rerun()
+
+
+def show_queue(st):
+    stats = job_queue().stats()
+    with st.expander(f"Render queue — {stats['depth']} queued, {stats['running']} running", expanded=False):
+        cols = st.columns(4)
+        cols[0].metric("Queued", stats["depth"])
+        cols[1].metric("Running", stats["running"])
+        cols[2].metric("Oldest wait", f"{stats['oldest_wait_s']:.0f}s")
+        cols[3].metric("Mean wait", f"{stats['mean_wait_s']:.0f}s")
+        if stats["workers"]:
+            st.table(stats["workers"])
+        st.table([{"job": j["id"], "title": j["spec"]["title"], "profile": j["spec"]["profile"], "status": j["status"],
+                   "videos": j["videos"]} for j in job_queue().recent(10)])
+
+
 def ui():
+    import streamlit as st
+
     st.set_page_config(page_title="Kids Story → Reels & Shorts", page_icon="📚", layout="centered")
+    warm_ollama()
     st.title("📚✨ Children’s Story → Instagram & YouTube Video (All Local)")
     st.caption("No subscriptions. Your compute = your only limit.")
 
@@ -327,53 +2631,55 @@ def ui():
         with col2:
             theme = st.text_input("Theme/Setting", value="kindness and sky adventures")
             num_scenes = st.slider("Number of Scenes", 6, 20, 8)
-            story_engine = st.selectbox("Story Engine", ["Built-in (rule-based)", "Ollama (local LLM)"])
+            story_engine = st.selectbox("Story Engine", STORY_ENGINES)
             ollama_model = st.text_input("Ollama Model", value=OLLAMA_MODEL)
 
         col3, col4 = st.columns(2)
         with col3:
-            tts_engine = st.selectbox("Narration Engine (Offline)", ["pyttsx3 (offline)", "Piper (offline)", "eSpeak (offline)"])
+            tts_engine = st.selectbox("Narration Engine (Offline)", TTS_ENGINES)
             voice_hint = st.text_input("Voice hint (pyttsx3/eSpeak)", value="")
         with col4:
             platforms = st.multiselect("Export Formats", ["Instagram Reels (9:16)", "YouTube (16:9)", "Both"], default=["Both"])
-        start = st.form_submit_button("Generate Story & Render Video")
+            render_engine = st.selectbox("Render Engine", list(RENDER_BACKENDS.keys()))
+        new_variation = st.checkbox("New story variation", value=False,
+                                    help="Ollama stories are cached per input; tick to write a fresh one.")
+        col5, col6 = st.columns(2)
+        with col5:
+            draft = st.form_submit_button("Quick Draft (360p preview)")
+        with col6:
+            start = st.form_submit_button("Generate Story & Render Video")
 
-    if start:
-        with st.spinner("Writing story..."):
-            if story_engine == "Ollama (local LLM)":
-                try:
-                    story_title, scenes = generate_story_ollama(title, age, theme, moral, minutes, num_scenes, model=ollama_model)
-                except Exception as e:
-                    st.warning(f"Ollama failed ({e}). Falling back to built-in.")
-                    story_title, scenes = generate_story_rule_based(title, age, theme, moral, minutes, num_scenes)
-            else:
-                story_title, scenes = generate_story_rule_based(title, age, theme, moral, minutes, num_scenes)
-        st.success(f"Story ready: {story_title}")
-        with st.expander("Preview Story Text"):
-            for i, sc in enumerate(scenes, start=1):
-                st.markdown(f"**Scene {i}.** {sc.text}")
-
-        targets = []
+    # Renders run in `python -m app worker` processes; the page only submits and polls, so a reload
+    # (or another user) never interrupts a job. The job id lives in the URL.
+    if start or draft:
+        formats = []
         if "Both" in platforms or "Instagram Reels (9:16)" in platforms:
-            targets.append((INSTAGRAM_RES, f"{ASSETS_DIR}/{slugify(story_title)}_IG_9x16.mp4"))
+            formats.append("instagram")
         if "Both" in platforms or "YouTube (16:9)" in platforms:
-            targets.append((YOUTUBE_RES, f"{ASSETS_DIR}/{slugify(story_title)}_YT_16x9.mp4"))
+            formats.append("youtube")
+        spec = StorySpec(title=title, age=age, theme=theme, moral=moral, minutes=minutes, scenes=num_scenes,
+                         story_engine=story_engine, ollama_model=ollama_model, tts_engine=tts_engine,
+                         voice_hint=voice_hint, render_engine=render_engine, formats=formats or list(FORMATS),
+                         profile="draft" if draft else "final",
+                         variation=random.randint(1, 2**31 - 1) if new_variation else 0)
+        st.query_params["job"] = str(job_queue().submit(spec))
 
-        results = []
-        for res, path in targets:
-            st.info(f"Rendering: {os.path.basename(path)} @ {res[0]}x{res[1]} …")
-            try:
-                out = build_video(scenes, res, path, voice_hint=voice_hint, tts_engine=tts_engine)
-                st.video(out)
-                results.append(out)
-            except Exception as e:
-                st.error(f"Failed to render {path}: {e}")
+    job_id = st.query_params.get("job")
+    job = job_queue().get(int(job_id)) if job_id and job_id.isdigit() else None
+    active = job is not None and job["status"] in ("queued", "running")
+
+    @st.fragment(run_every=2 if active else None)
+    def job_panel():
+        current = job_queue().get(job["id"])
+        if current["status"] != job["status"]:
+            st.rerun()  # full rerun: stop polling once finished, show the videos
+        show_job(st, current)
 
-        if results:
-            st.success("Done! Files saved below:")
-            for p in results:
-                st.write(f"📁 {os.path.abspath(p)}")
+    if job:
+        job_panel()
+    show_queue(st)
 
+    if job is not None and job["status"] in ("done", "failed"):
         st.markdown("---")
         st.subheader("Tips & Local-Only Pro Settings")
         st.markdown(
@@ -382,7 +2688,7 @@ def ui():
             - **Offline voices**: set `PIPER_PATH` and `PIPER_VOICE` env vars for Piper; or use `eSpeak`/`pyttsx3`.
             - **Local art**: run Stable Diffusion WebUI and set `SD_API=http://127.0.0.1:7860`.
             - **Music**: add royalty-free background later or extend this app to mix a track.
-            - **Scaling**: batch-produce by running multiple Streamlit sessions or wrapping `build_video` in a queue.
+            - **Scaling**: start more `python -m app worker` processes; they all serve the same queue.
             """
         )
 
@@ -18,5 +18,10 @@ if [ -z "$PIPER_VOICE" ] && [ -f "voices/en_US-amy-low.onnx" ]; then
   export PIPER_VOICE="voices/en_US-amy-low.onnx"
 fi
 
+# Render worker for jobs submitted from the Streamlit form (stopped with the app)
+python -m app worker &
+WORKER_PID=$!
+trap "kill $WORKER_PID 2>/dev/null" EXIT
+
 # Launch Streamlit app
 streamlit run app/app.py
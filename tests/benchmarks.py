@@ -0,0 +1,277 @@
+"""Micro-benchmarks for the render pipeline (run directly, not collected by pytest).
+
+    python tests/benchmarks.py render --scenes 4 --seconds 5
+"""
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import shlex
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import app as kids  # noqa: E402
+
+
+def write_silence(path, seconds, rate=22050):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(b"\x00\x00" * int(seconds * rate))
+    return path
+
+
+def make_assets(workdir, resolution, scenes, seconds):
+    assets = []
+    for i in range(1, scenes + 1):
+        img_path = os.path.join(workdir, f"scene_{i:02d}.png")
+        kids.fallback_illustration(f"Benchmark scene {i}, pastel", *resolution).save(img_path)
+        wav_path = write_silence(os.path.join(workdir, f"scene_{i:02d}.wav"), seconds)
+        assets.append(kids.SceneAsset(img_path, wav_path, seconds))
+    return assets
+
+
+def render_once(engine, assets, resolution, out):
+    # Runs in a fresh process so peak RSS belongs to this backend alone
+    import resource
+
+    wall0, cpu0 = time.perf_counter(), kids.cpu_seconds()
+    kids.RENDER_BACKENDS[engine]([kids.RenderTarget(resolution, out, assets)])
+    wall, cpu = time.perf_counter() - wall0, kids.cpu_seconds() - cpu0
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return wall, cpu, kids.peak_rss_mb(), child_rss
+
+
+def bench_render(args):
+    resolution = (args.width, args.height)
+    engines = args.engines or list(kids.RENDER_BACKENDS)
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        assets = make_assets(workdir, resolution, args.scenes, args.seconds)
+        output_minutes = sum(a.duration for a in assets) / 60.0
+        frames = sum(kids.scene_frames(a.duration) for a in assets)
+        print(f"{args.scenes} scenes x {args.seconds}s @ {resolution[0]}x{resolution[1]}, {kids.FPS} fps")
+        print(f"  {'engine':<28} {'wall s':>7} {'s/out-min':>9} {'cpu ms/frame':>12} {'py RSS MB':>9} {'ffmpeg RSS MB':>13}")
+        for name in engines:
+            out = os.path.join(workdir, f"{kids.slugify(name)}.mp4")
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                wall, cpu, rss, child_rss = pool.submit(render_once, name, assets, resolution, out).result()
+            print(f"  {name:<28} {wall:7.2f} {wall / output_minutes:9.2f} {cpu / frames * 1000:12.2f} "
+                  f"{rss:9.1f} {child_rss:13.1f}")
+
+
+def bench_multi(args):
+    formats = [kids.INSTAGRAM_RES, kids.YOUTUBE_RES]
+    formats = [(w // args.downscale, h // args.downscale) for w, h in formats]
+    with tempfile.TemporaryDirectory() as workdir:
+        targets = []
+        for res in formats:
+            res_dir = os.path.join(workdir, f"{res[0]}x{res[1]}")
+            os.makedirs(res_dir)
+            assets = make_assets(res_dir, res, args.scenes, args.seconds)
+            targets.append(kids.RenderTarget(res, os.path.join(res_dir, "out.mp4"), assets))
+        render = kids.RENDER_BACKENDS[args.engine]
+        print(f"{args.scenes} scenes x {args.seconds}s, formats {formats}, engine {args.engine}")
+
+        t0 = time.perf_counter()
+        for target in targets:
+            render([target])
+        separate = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        render(targets)
+        shared = time.perf_counter() - t0
+        print(f"  one render per format   {separate:7.2f}s")
+        print(f"  single multi-target pass {shared:7.2f}s")
+
+
+def legacy_fallback_illustration(prompt, width, height):
+    # fallback_illustration as it was before the NumPy gradient / cached background
+    img = Image.new("RGB", (width, height), (255, 252, 246))
+    draw = ImageDraw.Draw(img)
+    for y in range(height):
+        t = y / height
+        draw.line([(0, y), (width, y)], fill=(int(255 - 20*t), int(250 - 50*t), int(240 - 60*t)))
+    margin = int(min(width, height) * 0.03)
+    draw.rounded_rectangle([margin, margin, width - margin, height - margin], radius=margin, outline=(255, 230, 200), width=6)
+    bubble_w = int(width * 0.86)
+    bubble_h = int(height * 0.18)
+    bx = (width - bubble_w)//2
+    by = int(height * 0.72)
+    draw.rounded_rectangle([bx, by, bx + bubble_w, by + bubble_h], radius=24, fill=(255, 255, 255, 230), outline=(240, 220, 200), width=4)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", size=int(bubble_h*0.28))
+    except Exception:
+        font = ImageFont.load_default()
+    text = prompt.split(",")[0][:80]
+    tw, th = draw.textlength(text, font=font), font.size
+    draw.text((bx + (bubble_w - tw)//2, by + (bubble_h - th)//2), text, fill=(60, 60, 60), font=font)
+    return img
+
+
+def bench_fallback(args):
+    for resolution in (kids.INSTAGRAM_RES, kids.YOUTUBE_RES):
+        prompts = [f"Scene {i} of the story, pastel" for i in range(args.images)]
+        same = list(legacy_fallback_illustration(prompts[0], *resolution).getdata()) == \
+            list(kids.fallback_illustration(prompts[0], *resolution).getdata())
+        kids.fallback_background.cache_clear()
+        timings = {}
+        for name, fn in (("per-row draw.line", legacy_fallback_illustration), ("numpy + cached bg", kids.fallback_illustration)):
+            t0 = time.perf_counter()
+            for prompt in prompts:
+                fn(prompt, *resolution)
+            timings[name] = (time.perf_counter() - t0) / len(prompts)
+        print(f"{resolution[0]}x{resolution[1]} ({args.images} images, identical pixels: {same})")
+        for name, per_image in timings.items():
+            print(f"  {name:<20} {per_image * 1000:8.2f} ms/image")
+
+
+def bench_kenburns(args):
+    import numpy as np
+    from moviepy.editor import ImageClip
+
+    resolution = (args.width, args.height)
+    W, H = resolution
+    img = kids.fallback_illustration("Ken Burns benchmark", W, H)
+    out = np.empty((H, W, 3), dtype=np.uint8)
+    print(f"Ken Burns frame generation only (no encode) @ {W}x{H}, CPU ms/frame")
+    for seconds in args.seconds:
+        frames = kids.scene_frames(seconds)
+        row = {}
+        for name, source in (("index maps", kids.kenburns_frames), ("crop windows", kids.kenburns_crop_frames)):
+            t0 = time.process_time()
+            for _ in source(img, resolution, frames, out):
+                pass
+            row[name] = (time.process_time() - t0) / frames * 1000
+        clip = ImageClip(np.asarray(img)).set_duration(seconds)
+        clip = clip.fx(lambda c: c.resize(lambda t: 1 + (kids.ZOOM_END - 1) * (t / c.duration)))
+        sample = range(0, frames, 5)
+        t0 = time.process_time()
+        for f in sample:
+            clip.get_frame(f / kids.FPS)
+        row["moviepy resize"] = (time.process_time() - t0) / len(sample) * 1000
+        print(f"  {seconds:>5.1f}s scene: " + "  ".join(f"{name} {ms:6.1f}" for name, ms in row.items()))
+
+
+class MockSDHandler(BaseHTTPRequestHandler):
+    # Just enough of the WebUI API for make_images. Like the real server it renders one job at a
+    # time: every txt2img request pays `overhead` (queueing, model/sampler setup, encoding) plus
+    # `per_image` for each image it returns.
+    overhead = per_image = 0.0
+    requests = images = 0
+    gpu = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send({"sd_model_checkpoint": "mock.safetensors"})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if payload.get("script_name") == "prompts from file or textbox":
+            seeds = [int(shlex.split(line)[3]) for line in payload["script_args"][-1].splitlines()]
+        else:
+            seeds = [payload["seed"]] * payload.get("batch_size", 1) * payload.get("n_iter", 1)
+        with self.gpu:
+            cls = type(self)
+            cls.requests += 1
+            cls.images += len(seeds)
+            time.sleep(self.overhead + self.per_image * len(seeds))
+        images = []
+        for seed in seeds:
+            buf = io.BytesIO()
+            Image.new("RGB", (payload["width"], payload["height"]), (seed % 256, 128, 200)).save(buf, "PNG")
+            images.append(base64.b64encode(buf.getvalue()).decode())
+        self._send({"images": images, "parameters": payload})
+
+
+def bench_sd_batch(args):
+    MockSDHandler.overhead, MockSDHandler.per_image = args.overhead, args.per_image
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSDHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    kids.SD_API = f"http://127.0.0.1:{server.server_port}"
+    resolution = (args.width, args.height)
+    prompts = [f"Scene {i} of the story, pastel" for i in range(1, args.scenes + 1)]
+    seeds = [kids.scene_seed("bench", i) for i in range(1, args.scenes + 1)]
+    print(f"{args.scenes} scenes @ {resolution[0]}x{resolution[1]}, mock SD: {args.overhead * 1000:.0f} ms/request "
+          f"+ {args.per_image * 1000:.0f} ms/image, {kids.SD_CONCURRENCY} requests in flight")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for batch in sorted({1, args.batch}):
+            kids.SD_CACHE = kids.DiskCache(os.path.join(cache_dir, str(batch)), 0)  # every run goes to the server
+            MockSDHandler.requests = MockSDHandler.images = 0
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, kids.SD_CONCURRENCY)) as pool:
+                chunks = [range(j, min(j + batch, args.scenes)) for j in range(0, args.scenes, batch)]
+                futures = [pool.submit(kids.make_images, [prompts[j] for j in chunk], resolution,
+                                       [seeds[j] for j in chunk]) for chunk in chunks]
+                got = sum(len(f.result()) for f in futures)
+            wall = time.perf_counter() - t0
+            print(f"  SD_BATCH={batch:<3} {MockSDHandler.requests:4d} requests  {MockSDHandler.images:4d} images  "
+                  f"{wall:6.2f}s  {got / wall:6.2f} images/s")
+    server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("render", help="compare RENDER_BACKENDS (wall, CPU per frame, peak RSS) on synthetic scenes")
+    p.add_argument("--scenes", type=int, default=4)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--width", type=int, default=kids.INSTAGRAM_RES[0])
+    p.add_argument("--height", type=int, default=kids.INSTAGRAM_RES[1])
+    p.add_argument("--engines", nargs="*", choices=list(kids.RENDER_BACKENDS), help="default: all")
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("multi", help="both formats: separate renders vs one multi-target pass")
+    p.add_argument("--scenes", type=int, default=4)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--downscale", type=int, default=1, help="divide both resolutions for a quick run")
+    p.add_argument("--engine", default="ffmpeg (fast, native)", choices=list(kids.RENDER_BACKENDS))
+    p.set_defaults(func=bench_multi)
+
+    p = sub.add_parser("kenburns", help="per-frame CPU of the Ken Burns frame generators vs clip.resize")
+    p.add_argument("--seconds", type=float, nargs="*", default=[4.0, 10.0])
+    p.add_argument("--width", type=int, default=kids.INSTAGRAM_RES[0])
+    p.add_argument("--height", type=int, default=kids.INSTAGRAM_RES[1])
+    p.set_defaults(func=bench_kenburns)
+
+    p = sub.add_parser("fallback", help="fallback_illustration before/after the cached NumPy background")
+    p.add_argument("--images", type=int, default=20)
+    p.set_defaults(func=bench_fallback)
+
+    p = sub.add_parser("sd-batch", help="SD requests and images/s: one scene per request vs SD_BATCH (mock server)")
+    p.add_argument("--scenes", type=int, default=12)
+    p.add_argument("--batch", type=int, default=max(2, kids.SD_BATCH))
+    p.add_argument("--overhead", type=float, default=0.25, help="mock seconds per request")
+    p.add_argument("--per-image", type=float, default=0.1, help="mock seconds per image")
+    p.add_argument("--width", type=int, default=kids.INSTAGRAM_RES[0] // 2)
+    p.add_argument("--height", type=int, default=kids.INSTAGRAM_RES[1] // 2)
+    p.set_defaults(func=bench_sd_batch)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
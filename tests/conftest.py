@@ -0,0 +1,13 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# Same import as benchmarks.py; caches, scratch dirs and the job DB go to a throwaway dir, not outputs/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+_scratch = tempfile.mkdtemp(prefix="kids-tests-")
+atexit.register(shutil.rmtree, _scratch, True)
+for name in ("CACHE_DIR", "WORK_ROOT"):
+    os.environ.setdefault(name, os.path.join(_scratch, name.lower()))
+os.environ.setdefault("JOBS_DB", os.path.join(_scratch, "jobs.sqlite3"))
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import app as kids
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return kids.JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def spec(title="Mina"):
+    return kids.StorySpec(title=title, profile="draft")
+
+
+def test_claims_in_submission_order(jobs):
+    first, second = jobs.submit(spec("A")), jobs.submit(spec("B"))
+    jobs.register("w1")
+    job_id, claimed, draft = jobs.claim("w1")
+    assert (job_id, claimed.title, draft) == (first, "A", None)
+    assert jobs.claim("w1")[0] == second
+    assert jobs.claim("w1") is None
+    assert jobs.position(first) == 0
+
+
+def test_running_job_stays_with_a_live_worker(jobs):
+    job_id = jobs.submit(spec())
+    jobs.register("w1")
+    jobs.register("w2")
+    assert jobs.claim("w1")[0] == job_id
+    assert jobs.claim("w2") is None
+    assert jobs.get(job_id)["worker"] == "w1"
+
+
+def test_stale_worker_job_is_requeued(jobs, monkeypatch):
+    monkeypatch.setattr(kids, "WORKER_STALE", 0.2)
+    job_id = jobs.submit(spec())
+    jobs.register("w1")
+    jobs.claim("w1")
+    assert jobs.progress(job_id, "w1", {"last_stage": "story"})
+    time.sleep(0.3)  # w1 stops heartbeating
+    jobs.register("w2")
+    assert jobs.claim("w2")[0] == job_id
+    job = jobs.get(job_id)
+    assert (job["status"], job["worker"], job["progress"]) == ("running", "w2", None)
+    # w1 wakes up: its writes no longer land on the job w2 now holds
+    assert not jobs.progress(job_id, "w1", {"last_stage": "render"})
+    assert not jobs.finish(job_id, "w1", {"outputs": ["stale.mp4"]})
+    job = jobs.get(job_id)
+    assert (job["status"], job["progress"], job["result"]) == ("running", None, None)
+    assert jobs.finish(job_id, "w2", {"outputs": ["a.mp4"]})
+    assert jobs.get(job_id)["status"] == "done"
+
+
+def test_clean_exit_releases_the_job(jobs):
+    job_id = jobs.submit(spec())
+    jobs.register("w1")
+    jobs.claim("w1")
+    jobs.heartbeat("w1", alive=False)
+    jobs.register("w2")
+    assert jobs.claim("w2")[0] == job_id
+
+
+def test_draft_travels_with_the_job(jobs):
+    draft = {"title": "T", "scenes": [], "narration": []}
+    job_id = jobs.submit(spec(), draft=draft)
+    jobs.register("w1")
+    assert jobs.claim("w1")[2] == draft
+    assert jobs.get(job_id)["draft"] == draft
+
+
+def test_finish_records_result_and_stats(jobs):
+    ok, bad = jobs.submit(spec("A")), jobs.submit(spec("B"))
+    jobs.register("w1")
+    jobs.claim("w1")
+    assert jobs.finish(ok, "w1", {"outputs": ["a.mp4", "b.mp4"]})
+    jobs.claim("w1")
+    assert jobs.finish(bad, "w1", {"status": "error", "error": "boom"})
+    assert jobs.get(ok)["status"] == "done" and jobs.get(ok)["videos"] == 2
+    assert (jobs.get(bad)["status"], jobs.get(bad)["error"]) == ("failed", "boom")
+    stats = jobs.stats()
+    assert (stats["depth"], stats["running"], stats["done"], stats["failed"]) == (0, 0, 1, 1)
+    worker, = stats["workers"]
+    assert (worker["name"], worker["alive"], worker["done"], worker["failed"], worker["videos"]) == \
+        ("w1", True, 1, 1, 2)
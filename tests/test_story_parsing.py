@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import app as kids
+
+STORY = {
+    "title": "Mina and the \"Brave\" Kite",
+    "scenes": [
+        {"text": "Mina finds a kite {torn} at the edge.", "prompt": "girl, kite, hill"},
+        {"text": "She says \"let's fix it\" with a smile.", "prompt": "girl, glue, \\ table"},
+        {"text": "The kite flies over the town.", "prompt": "kite, sky, town"},
+    ],
+}
+
+
+def test_loads_repaired_plain_json():
+    assert kids.loads_repaired(json.dumps(STORY)) == STORY
+
+
+def test_loads_repaired_strips_fences_and_prose():
+    text = "Here is your story:\n```json\n" + json.dumps(STORY, indent=2) + "\n```\nEnjoy!"
+    assert kids.loads_repaired(text) == STORY
+
+
+def test_loads_repaired_drops_trailing_commas():
+    text = '{"title": "T", "scenes": [{"text": "a", "prompt": "b",}, {"text": "c", "prompt": "d"},],}'
+    assert kids.loads_repaired(text) == {"title": "T", "scenes": [{"text": "a", "prompt": "b"},
+                                                                  {"text": "c", "prompt": "d"}]}
+
+
+def test_loads_repaired_raises_when_unrepairable():
+    with pytest.raises(ValueError):
+        kids.loads_repaired('{"title": "T", "scenes": [{"text": "a"')
+
+
+def test_parse_llm_story_complete():
+    title, objs, complete = kids.parse_llm_story("```\n" + json.dumps(STORY) + "\n```")
+    assert (title, objs, complete) == (STORY["title"], STORY["scenes"], True)
+
+
+def test_parse_llm_story_salvages_truncated_reply():
+    text = json.dumps(STORY)
+    cut = text[:text.index("The kite flies") + 5]  # num_predict ran out inside the third scene
+    title, objs, complete = kids.parse_llm_story(cut)
+    assert title == STORY["title"]
+    assert objs == STORY["scenes"][:2]
+    assert complete is False
+
+
+def test_parse_llm_story_nothing_salvageable():
+    assert kids.parse_llm_story("Sorry, I can't help with that.") == (None, [], False)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_stream_parser_any_chunking(size):
+    text = "```json\n" + json.dumps(STORY, indent=1) + "\n```"
+    parser = kids.SceneStreamParser()
+    objs = []
+    for i in range(0, len(text), size):
+        objs += parser.feed(text[i:i + size])
+    assert objs == STORY["scenes"]
+    assert parser.title == STORY["title"]
+    assert parser.done
+
+
+def test_stream_parser_escape_split_across_chunks():
+    # The backslash ends one chunk and the escaped quote starts the next: the quote must not close the string
+    text = json.dumps({"title": "T", "scenes": [{"text": 'a "}" b', "prompt": "p"}]})
+    split = text.index('\\"') + 1
+    parser = kids.SceneStreamParser()
+    assert parser.feed(text[:split]) == []
+    assert parser.feed(text[split:]) == [{"text": 'a "}" b', "prompt": "p"}]
+
+
+def test_stream_parser_yields_each_scene_when_it_closes():
+    parser = kids.SceneStreamParser()
+    assert parser.feed('{"title": "T", "scenes": [{"text": "one", "prompt": "p"},') == [{"text": "one", "prompt": "p"}]
+    assert parser.title == "T"
+    assert parser.feed(' {"text": "two", "prompt": "q",') == []
+    assert parser.feed('}]}') == [{"text": "two", "prompt": "q"}]
+    assert parser.done
+
+
+def test_stream_parser_skips_unparsable_scene():
+    parser = kids.SceneStreamParser()
+    objs = parser.feed('{"scenes": [{"text": "ok", "prompt": "p"}, {"text": oops}, {"text": "ok2", "prompt": "q"}]}')
+    assert objs == [{"text": "ok", "prompt": "p"}, {"text": "ok2", "prompt": "q"}]
+    assert parser.title is None
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+import app as kids
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def out_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(kids, "WORK_ROOT", str(tmp_path / "work"))
+    monkeypatch.setattr(kids, "WORK_RETENTION_H", 24)
+    monkeypatch.setattr(kids, "OUTPUT_RETENTION_DAYS", 30)
+    monkeypatch.setattr(kids, "OUTPUT_QUOTA_MB", 0)
+    out = tmp_path / "out"
+    out.mkdir()
+    return out
+
+
+def put(path, size, age_s):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+    then = time.time() - age_s
+    os.utime(path, (then, then))
+    return path
+
+
+def test_quota_evicts_oldest_videos_with_their_reports(out_dir, monkeypatch):
+    monkeypatch.setattr(kids, "OUTPUT_QUOTA_MB", 1)
+    old = put(out_dir / "old.mp4", MB // 2, 300)
+    old_report = put(out_dir / "old.report.json", 100, 300)
+    mid = put(out_dir / "mid.mp4", MB // 2, 200)
+    new = put(out_dir / "new.mp4", MB // 2, 100)
+    swept = kids.sweep_outputs(str(out_dir))
+    assert not old.exists() and not old_report.exists()
+    assert mid.exists() and new.exists()
+    assert swept["videos"] == 1
+    assert swept["bytes_freed"] == MB // 2 + 100
+    assert swept["bytes_kept"] == MB
+
+
+def test_scratch_counts_against_the_quota(out_dir, monkeypatch):
+    monkeypatch.setattr(kids, "OUTPUT_QUOTA_MB", 1)
+    put(out_dir.parent / "work" / "job-1" / "narration.wav", MB // 2, 60)  # a render in progress
+    old = put(out_dir / "old.mp4", MB // 2, 200)
+    new = put(out_dir / "new.mp4", MB // 4, 100)
+    kids.sweep_outputs(str(out_dir))
+    assert not old.exists() and new.exists()
+
+
+def test_retention_expires_videos_partials_and_workdirs(out_dir):
+    expired = put(out_dir / "expired.mp4", 10, 31 * 86400)
+    kept = put(out_dir / "kept.mp4", 10, 29 * 86400)
+    stale_partial = put(out_dir / ".stale.mp4", 10, 25 * 3600)
+    fresh_partial = put(out_dir / ".fresh.mp4", 10, 60)
+    stale_work = put(out_dir.parent / "work" / "job-old" / "scene.png", 10, 25 * 3600)
+    then = time.time() - 25 * 3600
+    os.utime(stale_work.parent, (then, then))  # the dir's own mtime counts as activity too
+    fresh_work = put(out_dir.parent / "work" / "job-new" / "scene.png", 10, 60)
+    swept = kids.sweep_outputs(str(out_dir))
+    assert (swept["videos"], swept["partials"], swept["workdirs"]) == (1, 1, 1)
+    assert not expired.exists() and not stale_partial.exists() and not stale_work.parent.exists()
+    assert kept.exists() and fresh_partial.exists() and fresh_work.exists()
+
+
+def test_unlimited_quota_keeps_everything(out_dir, monkeypatch):
+    monkeypatch.setattr(kids, "OUTPUT_RETENTION_DAYS", 0)
+    video = put(out_dir / "ancient.mp4", MB, 400 * 86400)
+    assert kids.sweep_outputs(str(out_dir))["videos"] == 0
+    assert video.exists()